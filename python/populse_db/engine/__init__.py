@@ -158,6 +158,19 @@ class Engine:
         """
         raise NotImplementedError()
 
+
+    def add_fields(self, fields):
+        """
+        Adds several new fields at once. This is equivalent to calling
+        add_field() for each field but allows the engine to group
+        database operations.
+
+        :param fields: list of (collection, field, type, description, index)
+           tuples. Each element has the same meaning as the corresponding
+           parameter of add_field().
+        """
+        raise NotImplementedError()
+
             
     def has_field(self, collection, field):
         """
@@ -228,6 +241,16 @@ class Engine:
         raise NotImplementedError()
 
 
+    def document_ids(self, collection):
+        """
+        Returns the list of the identifiers (i.e. primary key values) of all
+        the documents of a collection.
+
+        :param collection: collection name (str, must be existing)
+        """
+        raise NotImplementedError()
+
+
     def document(self, collection, document_id,
                  fields=None, as_list=False):
         """
@@ -251,6 +274,22 @@ class Engine:
         raise NotImplementedError()
 
     
+    def add_documents(self, collection, documents, create_missing_fields):
+        """
+        Adds several new documents in a collection.
+
+        :param collection: collection name (str, must be existing)
+
+        :param documents: list of documents. Each document is a dict
+            with field/value pairs that must contain the primary key.
+
+        :param create_missing_fields: if True, fields that are in a
+            document but not in the collection are created (the field type
+            is guessed from the value). Otherwise a ValueError is raised.
+        """
+        raise NotImplementedError()
+
+    
     def has_value(self, collection, document_id, field):
         """
         Check if a document has a not null value for a given field.
@@ -268,6 +307,8 @@ class Engine:
             key field (str)
 
         :param values: dictionary with field/value pairs (dict)
+
+        :raise ValueError: if the document does not exist
         """
         raise NotImplementedError()
 
@@ -294,6 +335,8 @@ class Engine:
 
         :param document_id: document identifier: the value of the primary
             key field (str)
+
+        :raise ValueError: if the document does not exist
         """
         raise NotImplementedError()
 
@@ -301,7 +344,8 @@ class Engine:
     def parse_filter(self, collection, filter):
         """
         Given a filter string, return a internal query representation that
-        can be used with filter_documents() to select documents
+        can be used with filter_documents() to select documents. The query
+        is a tuple whose first item is the collection.
 
 
         :param collection: the collection for which the filter is intended 
@@ -328,3 +372,14 @@ class Engine:
         """
         raise NotImplementedError()
 
+
+    def filter_document_ids(self, parsed_filter):
+        """
+        Returns the list of the identifiers (i.e. primary key values) of the
+        documents selected by a filter.
+
+        :param parsed_filter: internal object representing a filter on a
+            collection (filter object returned by parse_filter())
+        """
+        raise NotImplementedError()
+
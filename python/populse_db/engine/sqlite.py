@@ -1,3 +1,4 @@
+from collections import OrderedDict
 import datetime
 import hashlib
 import json
@@ -8,11 +9,11 @@ import sqlite3
 import threading
 import uuid
 
+from lark.exceptions import VisitError
+
 import populse_db.database as pdb
 from populse_db.engine import Engine
-from populse_db.filter import FilterToQuery, filter_parser
-
-import dateutil
+from populse_db.filter import FilterToQuery, parse_filter_tree
 
 '''
 SQLite3 implementation of populse_db engine.
@@ -24,6 +25,42 @@ A populse_db engine is created when a DatabaseSession object is created
 # Table names
 FIELD_TABLE = '_field'
 COLLECTION_TABLE = '_collection'
+
+_upper_case_re = re.compile('([A-Z])')
+
+def _from_isoformat(python_type, dateutil_converter):
+    """
+    Returns a function converting a string produced by isoformat() into
+    a value of python_type. The fast fromisoformat() method is used when
+    available (Python >= 3.7) and dateutil parser is used as a fallback.
+    """
+    def dateutil_parse(x):
+        # dateutil is only imported when it is actually needed
+        import dateutil.parser
+        return dateutil_converter(dateutil.parser.parse(x))
+
+    fromisoformat = getattr(python_type, 'fromisoformat', None)
+    if fromisoformat is None:
+        return dateutil_parse
+    def converter(x):
+        try:
+            return fromisoformat(x)
+        except ValueError:
+            return dateutil_parse(x)
+    return converter
+
+# The MD5 list hash is not used for security. Saying so allows to use it on
+# systems restricting cryptographic algorithms (e.g. FIPS mode).
+try:
+    hashlib.md5(usedforsecurity=False)
+    def _md5(data):
+        return hashlib.md5(data, usedforsecurity=False)
+except TypeError:
+    # Python < 3.9
+    _md5 = hashlib.md5
+
+# ALTER TABLE ... DROP COLUMN is supported since SQLite 3.35.0
+_has_drop_column = sqlite3.sqlite_version_info >= (3, 35, 0)
                 
 class SQLiteEngine(Engine):
     
@@ -32,22 +69,56 @@ class SQLiteEngine(Engine):
     
     def __init__(self, database):
         self._enter_recursion_count = 0
+        # Value of PRAGMA schema_version corresponding to the content of
+        # the metadata caches, None if the caches must be reloaded.
+        self._schema_version = None
+        # Row classes of the metadata tables, their columns never change
+        self._meta_table_row = {}
+        # database can be an SQLite URI such as "file:/tmp/db.sqlite?mode=ro"
+        # to open an existing database in read-only mode.
+        connect_kwargs = {}
+        if database.startswith('file:'):
+            if six.PY2:
+                raise ValueError('SQLite URIs (%s) require Python 3' % database)
+            path, _, query = database[5:].partition('?')
+            read_only = 'mode=ro' in query.split('&')
+            connect_kwargs['uri'] = True
+        else:
+            path = database
+            read_only = False
         with self._global_lock:
+            # Statements are built per table and per column, the default
+            # cache of prepared statements is too small to keep them all.
             self.connection = sqlite3.connect(database, 
                                             isolation_level=None,
-                                            check_same_thread=False)
+                                            check_same_thread=False,
+                                            cached_statements=512,
+                                            **connect_kwargs)
+            # Per connection settings are done once and not at each
+            # transaction start.
+            self.connection.execute('PRAGMA synchronous=OFF')
+            self.connection.execute('PRAGMA case_sensitive_like=ON')
+            self.connection.execute('PRAGMA foreign_keys=ON')
+            self.connection.execute('PRAGMA cache_size=-20000')
+            self.connection.execute('PRAGMA temp_store=MEMORY')
             self.cursor = None
-            if database == ':memory:':
+            if path == ':memory:':
                 self._global_lock_id = None
                 self.lock = threading.RLock()
             else:
-                self._global_lock_id = osp.normpath(osp.realpath(osp.abspath(database)))
+                self._global_lock_id = osp.normpath(osp.realpath(osp.abspath(path)))
                 self.lock, lock_count = self._database_locks.get(self._global_lock_id) or (None, None)
                 if self.lock is None:
                     self.lock = threading.RLock()
                     self._database_locks[self._global_lock_id] = (self.lock, 1)
                 else:
                     self._database_locks[self._global_lock_id] = (self.lock, lock_count + 1)
+                # Write-ahead logging avoids blocking readers during
+                # writes. It is not available for in-memory databases and
+                # cannot be changed by a read-only connection.
+                if not read_only:
+                    self.connection.execute('PRAGMA journal_mode=WAL')
+                self.connection.execute('PRAGMA mmap_size=268435456')
 
     def __del__(self):
         if self._global_lock_id:
@@ -59,6 +130,9 @@ class SQLiteEngine(Engine):
                 else:
                     del self._database_locks[self._global_lock_id]
     
+    # Cache shared by all engines since the conversion only depends on name
+    _name_to_sql = {}
+
     def name_to_sql(self, name):
         """
         Transforms the name into a valid and unique SQLite table/column name.
@@ -70,88 +144,133 @@ class SQLiteEngine(Engine):
 
         :return: Valid and unique table/column name
         """
-        return re.sub('([A-Z])', r'!\1', name)
+        sql_name = self._name_to_sql.get(name)
+        if sql_name is None:
+            sql_name = _upper_case_re.sub(r'!\1', name)
+            self._name_to_sql[name] = sql_name
+        return sql_name
 
     def __enter__(self):
         if self._enter_recursion_count == 0:
             self.lock.acquire()
             self.cursor = self.connection.cursor()
-            self.cursor.execute('PRAGMA synchronous=OFF')
-            self.cursor.execute('PRAGMA case_sensitive_like=ON')
-            self.cursor.execute('PRAGMA foreign_keys=ON')
             self.cursor.execute('BEGIN DEFERRED')
             
-            if not self.has_table(COLLECTION_TABLE):
-                sql = '''CREATE TABLE [{0}] (
-                    collection_name TEXT,
-                    field_name TEXT,
-                    field_type TEXT CHECK(field_type IN ({1})) NOT NULL,
-                    description TEXT,
-                    has_index BOOLEAN NOT NULL,
-                    column TEXT NOT NULL,
-                    PRIMARY KEY (field_name, collection_name))
-                '''.format(FIELD_TABLE,
-                        ','.join("'%s'" % i for i in (pdb.FIELD_TYPE_STRING,
-                                                    pdb.FIELD_TYPE_INTEGER, 
-                                                    pdb.FIELD_TYPE_FLOAT, 
-                                                    pdb.FIELD_TYPE_BOOLEAN,
-                                                    pdb.FIELD_TYPE_DATE,
-                                                    pdb.FIELD_TYPE_DATETIME,
-                                                    pdb.FIELD_TYPE_TIME,
-                                                    pdb.FIELD_TYPE_JSON,
-                                                    pdb.FIELD_TYPE_LIST_STRING,
-                                                    pdb.FIELD_TYPE_LIST_INTEGER,
-                                                    pdb.FIELD_TYPE_LIST_FLOAT,
-                                                    pdb.FIELD_TYPE_LIST_BOOLEAN,
-                                                    pdb.FIELD_TYPE_LIST_DATE,
-                                                    pdb.FIELD_TYPE_LIST_DATETIME,
-                                                    pdb.FIELD_TYPE_LIST_TIME,
-                                                    pdb.FIELD_TYPE_LIST_JSON)))
-                self.cursor.execute(sql)
-                
-                sql = '''CREATE TABLE [{0}] (
-                    collection_name TEXT PRIMARY KEY,
-                    primary_key TEXT NOT NULL,
-                    table_name TEXT NOT NULL)
-                '''.format(COLLECTION_TABLE)
-                self.cursor.execute(sql)
-            
-            
-            self.collection_primary_key = {}
-            self.collection_table = {}
-            self.table_row = {}
-            self.table_document = {}
-            for table in (COLLECTION_TABLE, FIELD_TABLE):
-                sql = 'PRAGMA table_info([%s])' % table
-                self.cursor.execute(sql)
-                columns = [i[1] for i in self.cursor]
-                self.table_row[table] = pdb.list_with_keys(table, columns)
-            sql = 'SELECT collection_name, table_name, primary_key FROM [%s]' % COLLECTION_TABLE
+            # Any change in collections or fields modifies the schema,
+            # caches are valid as long as the schema version is unchanged.
+            self.cursor.execute('PRAGMA schema_version')
+            if self.cursor.fetchone()[0] != self._schema_version:
+                self._create_schema_and_load_caches()
+        
+        self._enter_recursion_count += 1
+        return self
+    
+    def _create_schema_and_load_caches(self):
+        """
+        Creates the tables containing collections and fields metadata if
+        they do not exist then loads the caches.
+        """
+        if not self.has_table(COLLECTION_TABLE):
+            sql = '''CREATE TABLE [{0}] (
+                collection_name TEXT,
+                field_name TEXT,
+                field_type TEXT CHECK(field_type IN ({1})) NOT NULL,
+                description TEXT,
+                has_index BOOLEAN NOT NULL,
+                column TEXT NOT NULL,
+                PRIMARY KEY (field_name, collection_name))
+            '''.format(FIELD_TABLE,
+                    ','.join("'%s'" % i for i in (pdb.FIELD_TYPE_STRING,
+                                                pdb.FIELD_TYPE_INTEGER, 
+                                                pdb.FIELD_TYPE_FLOAT, 
+                                                pdb.FIELD_TYPE_BOOLEAN,
+                                                pdb.FIELD_TYPE_DATE,
+                                                pdb.FIELD_TYPE_DATETIME,
+                                                pdb.FIELD_TYPE_TIME,
+                                                pdb.FIELD_TYPE_JSON,
+                                                pdb.FIELD_TYPE_LIST_STRING,
+                                                pdb.FIELD_TYPE_LIST_INTEGER,
+                                                pdb.FIELD_TYPE_LIST_FLOAT,
+                                                pdb.FIELD_TYPE_LIST_BOOLEAN,
+                                                pdb.FIELD_TYPE_LIST_DATE,
+                                                pdb.FIELD_TYPE_LIST_DATETIME,
+                                                pdb.FIELD_TYPE_LIST_TIME,
+                                                pdb.FIELD_TYPE_LIST_JSON)))
             self.cursor.execute(sql)
-            for i in self.cursor.fetchall():
-                collection, table, primary_key = i
-                self.collection_primary_key[collection] = primary_key
-                self.collection_table[collection] = table
-                sql = "SELECT field_name, column FROM [%s] WHERE collection_name = '%s'" % (FIELD_TABLE, collection)
-                self.cursor.execute(sql)
-                rows = self.cursor.fetchall()
-                fields = [i[0] for i in rows]
-                columns = [i[1] for i in rows]
-                self.table_row[table] = pdb.list_with_keys(table, columns)
-                self.table_document[table] = pdb.list_with_keys(table, fields)
             
-            sql = 'SELECT collection_name, field_name, field_type, column FROM [%s]' % FIELD_TABLE
+            sql = '''CREATE TABLE [{0}] (
+                collection_name TEXT PRIMARY KEY,
+                primary_key TEXT NOT NULL,
+                table_name TEXT NOT NULL)
+            '''.format(COLLECTION_TABLE)
             self.cursor.execute(sql)
-            self.field_column = {}
-            self.field_type = {}
-            for collection, field, field_type, column in self.cursor:
-                self.field_column.setdefault(collection, {})[field] = column
-                self.field_type.setdefault(collection, {})[field] = field_type
         
-        self._enter_recursion_count += 1
-        return self
+        self._load_caches()
     
+    def _load_caches(self):
+        """
+        Reads all collections and fields metadata with one query per
+        table and build the caches used to avoid querying the database
+        for metadata.
+        """
+        self.collection_primary_key = {}
+        self.collection_pk_column = {}
+        self.collection_table = {}
+        self.collection_row = OrderedDict()
+        self.table_row = {}
+        self.table_document = {}
+        self.field_column = {}
+        self.field_type = {}
+        self.field_row = {}
+        # SQL WHERE clauses of parsed filters, they depend on the schema
+        self.filter_where = {}
+        for table in (COLLECTION_TABLE, FIELD_TABLE):
+            row_class = self._meta_table_row.get(table)
+            if row_class is None:
+                sql = 'PRAGMA table_info([%s])' % table
+                self.cursor.execute(sql)
+                columns = [i[1] for i in self.cursor]
+                row_class = pdb.list_with_keys(table, columns)
+                self._meta_table_row[table] = row_class
+            self.table_row[table] = row_class
+        
+        row_class = self.table_row[COLLECTION_TABLE]
+        sql = 'SELECT %s FROM [%s]' % (
+            ','.join('[%s]' % i for i in row_class._key_indices),
+            COLLECTION_TABLE)
+        self.cursor.execute(sql)
+        for row in self.cursor.fetchall():
+            row = row_class(*row)
+            collection = row.collection_name
+            self.collection_row[collection] = row
+            self.collection_primary_key[collection] = row.primary_key
+            self.collection_table[collection] = row.table_name
+            self.field_row[collection] = OrderedDict()
+            self.field_column[collection] = {}
+            self.field_type[collection] = {}
+        
+        row_class = self.table_row[FIELD_TABLE]
+        sql = 'SELECT %s FROM [%s]' % (
+            ','.join('[%s]' % i for i in row_class._key_indices),
+            FIELD_TABLE)
+        self.cursor.execute(sql)
+        for row in self.cursor.fetchall():
+            row = row_class(*row)
+            collection = row.collection_name
+            self.field_row[collection][row.field_name] = row
+            self.field_column[collection][row.field_name] = row.column
+            self.field_type[collection][row.field_name] = row.field_type
+            if row.field_name == self.collection_primary_key[collection]:
+                self.collection_pk_column[collection] = row.column
+        
+        for collection, table in self.collection_table.items():
+            field_rows = self.field_row[collection].values()
+            self.table_row[table] = pdb.list_with_keys(table, [i.column for i in field_rows])
+            self.table_document[table] = pdb.list_with_keys(table, [i.field_name for i in field_rows])
+
     def commit(self):
+        self.cursor.execute('PRAGMA schema_version')
+        self._schema_version = self.cursor.fetchone()[0]
         try:
             self.cursor.execute('COMMIT')
         except sqlite3.OperationalError as e:
@@ -160,16 +279,26 @@ class SQLiteEngine(Engine):
     
     def rollback(self):
         self.cursor.execute('ROLLBACK')
+        # Caches may contain collections and fields created or removed by
+        # the rolled back transaction, they are reloaded by the next
+        # __enter__.
+        self._schema_version = None
+        if self._enter_recursion_count > 0:
+            # The session goes on and uses the caches. The metadata tables
+            # are created again if their creation was rolled back.
+            self._create_schema_and_load_caches()
         
     def __exit__(self, exc_type, exc_val, exc_tb):
         self._enter_recursion_count -= 1
         if self._enter_recursion_count == 0:
-            if exc_type is None:
-                self.commit()
-            else:
-                self.rollback()
-            self.cursor = None
-            self.lock.release()
+            try:
+                if exc_type is None:
+                    self.commit()
+                else:
+                    self.rollback()
+            finally:
+                self.cursor = None
+                self.lock.release()
     
     type_to_sql = {
         pdb.FIELD_TYPE_INTEGER: 'INT',
@@ -180,13 +309,19 @@ class SQLiteEngine(Engine):
         pdb.FIELD_TYPE_TIME: 'TEXT',
         pdb.FIELD_TYPE_STRING: 'TEXT',
         pdb.FIELD_TYPE_JSON: 'STRING',
+        # The column of a list field contains the hash of the list
+        pdb.FIELD_TYPE_LIST_INTEGER: 'TEXT',
+        pdb.FIELD_TYPE_LIST_FLOAT: 'TEXT',
+        pdb.FIELD_TYPE_LIST_BOOLEAN: 'TEXT',
+        pdb.FIELD_TYPE_LIST_DATE: 'TEXT',
+        pdb.FIELD_TYPE_LIST_DATETIME: 'TEXT',
+        pdb.FIELD_TYPE_LIST_TIME: 'TEXT',
+        pdb.FIELD_TYPE_LIST_STRING: 'TEXT',
+        pdb.FIELD_TYPE_LIST_JSON: 'TEXT',
     }
     
     def sql_type(self, type):
-        if type.startswith('list_'):
-            return 'TEXT'
-        else:
-            return self.type_to_sql[type]
+        return self.type_to_sql[type]
     
     @staticmethod
     def list_hash(list):
@@ -194,11 +329,9 @@ class SQLiteEngine(Engine):
             return None
         if not list:
             return ''
-        m = hashlib.md5()
-        for i in list:
-            m.update(six.text_type(i).encode('utf8'))
-        hash = m.hexdigest()
-        return hash
+        # Hashing the concatenation of all items gives the same digest as
+        # updating the hash item by item, with a single call to md5.
+        return _md5(u''.join(six.text_type(i) for i in list).encode('utf8')).hexdigest()
     
     def clear(self):
         tables = [FIELD_TABLE, COLLECTION_TABLE]
@@ -209,11 +342,8 @@ class SQLiteEngine(Engine):
         for table in tables:
             sql = 'DROP TABLE [%s]' % table
             self.cursor.execute(sql)
-        self.collection_table = {}
-        self.table_row = {}
-        self.table_document = {}
-        self.field_column = {}
-        self.field_type = {}
+        # The database is left empty but valid
+        self._create_schema_and_load_caches()
         
     def has_table(self, table):
         self.cursor.execute("SELECT count(*) FROM sqlite_master WHERE type='table' AND name='%s'" % table)
@@ -237,30 +367,37 @@ class SQLiteEngine(Engine):
         self.cursor.execute(sql, [collection, primary_key, table_name])
         self.collection_table[collection] = table_name
         self.collection_primary_key[collection] = primary_key
+        self.collection_pk_column[collection] = pk_column
+        self.collection_row[collection] = self.table_row[COLLECTION_TABLE](
+            collection_name=collection,
+            primary_key=primary_key,
+            table_name=table_name)
         
         sql = 'INSERT INTO [%s] (field_name, collection_name, field_type, description, has_index, column) VALUES (?, ?, ?, ?, 1, ?)' % FIELD_TABLE
+        description = 'Primary_key of the document collection %s' % collection
         self.cursor.execute(sql, [primary_key, collection, pdb.FIELD_TYPE_STRING,
-                                  'Primary_key of the document collection %s' % collection,
+                                  description,
                                   pk_column])
         self.field_column[collection] = {primary_key: pk_column}
         self.field_type[collection] = {primary_key: pdb.FIELD_TYPE_STRING}
+        self.field_row[collection] = OrderedDict()
+        self.field_row[collection][primary_key] = self.table_row[FIELD_TABLE](
+            field_name=primary_key,
+            collection_name=collection,
+            field_type=pdb.FIELD_TYPE_STRING,
+            description=description,
+            has_index=1,
+            column=pk_column)
         
     def collection(self, collection):
-        row_class = self.table_row[COLLECTION_TABLE]
-        sql = 'SELECT %s FROM [%s] WHERE collection_name = ?' % (
-            ','.join('[%s]' % i for i in row_class._key_indices),
-            COLLECTION_TABLE)
-        self.cursor.execute(sql, [collection])
-        row = self.cursor.fetchone()
-        if row is not None:
-            return row_class(*row)
-        return None
+        return self.collection_row.get(collection)
     
     def primary_key(self, collection):
         return self.collection_primary_key[collection]
     
     def remove_collection(self, collection):
         table = self.collection_table[collection]
+        self.filter_where.clear()
         
         sql = 'DELETE FROM [%s] WHERE collection_name = ?' % FIELD_TABLE
         self.cursor.execute(sql, [collection])
@@ -269,60 +406,88 @@ class SQLiteEngine(Engine):
         self.cursor.execute(sql, [collection])
         del self.collection_table[collection]
         del self.collection_primary_key[collection]
+        del self.collection_pk_column[collection]
+        del self.collection_row[collection]
         del self.table_row[table]
         del self.table_document[table]
         del self.field_column[collection]
         del self.field_type[collection]
+        del self.field_row[collection]
         
         sql = 'DROP TABLE [%s]' % table
         self.cursor.execute(sql)
 
     def collections(self):
-        row_class = self.table_row[COLLECTION_TABLE]
-        sql = 'SELECT %s FROM [%s]' % (
-            ','.join('[%s]' % i for i in row_class._key_indices),
-            COLLECTION_TABLE)
-        return [self.table_row[COLLECTION_TABLE](*i) for i in self.cursor.execute(sql)]
+        return list(self.collection_row.values())
 
     def add_field(self, collection, field, type, description, index):
-        table = self.collection_table[collection]
-        column = self.name_to_sql(field)
-        sql = 'ALTER TABLE [%s] ADD COLUMN [%s] %s' % (table, column, self.sql_type(type))
-        table_row = self.table_row[table]
-        table_row._append_key(column)
-        table_doc = self.table_document[table]
-        table_doc._append_key(field)
-        
-        self.cursor.execute(sql)
-        sql = 'INSERT INTO [%s] (field_name, collection_name, field_type, description, has_index, column) VALUES (?, ?, ?, ?, ?, ?)' % FIELD_TABLE
-        self.cursor.execute(sql, [field,
-                                  collection,
-                                  type,
-                                  description,
-                                  (1 if index else 0),
-                                  column])
-        self.field_column.setdefault(collection, {})[field] = column
-        self.field_type.setdefault(collection, {})[field] = type
-        if index:
-            sql = 'CREATE INDEX [{0}_{1}] ON [{0}] ([{1}])'.format(table, column)
-            self.cursor.execute(sql)
-        if type.startswith('list_'):
-            sql = 'CREATE TABLE [list_{0}_{1}] (list_id TEXT NOT NULL, i INT, value {2})'.format(table, column, self.sql_type(type[5:]))
-            self.cursor.execute(sql)
-            sql = 'CREATE INDEX [list_{0}_{1}_id] ON [list_{0}_{1}] (list_id)'.format(table, column)
-            self.cursor.execute(sql)
-            sql = 'CREATE INDEX [list_{0}_{1}_i] ON [list_{0}_{1}] (i ASC)'.format(table, column)
+        self.add_fields([(collection, field, type, description, index)])
+
+    def add_fields(self, fields):
+        # SQLite only accepts one column per ALTER TABLE. The metadata of
+        # each field is inserted right after its column is created, so
+        # that the fields created before an error remain valid fields.
+        insert_field = 'INSERT INTO [%s] (field_name, collection_name, field_type, description, has_index, column) VALUES (?, ?, ?, ?, ?, ?)' % FIELD_TABLE
+        for collection, field, type, description, index in fields:
+            table = self.collection_table[collection]
+            column = self.name_to_sql(field)
+            sql = 'ALTER TABLE [%s] ADD COLUMN [%s] %s' % (table, column, self.sql_type(type))
             self.cursor.execute(sql)
+            self.cursor.execute(insert_field, [field,
+                                               collection,
+                                               type,
+                                               description,
+                                               (1 if index else 0),
+                                               column])
+            # Row classes are shared with the documents already returned,
+            # they are replaced instead of being modified.
+            row_class = self.table_row[table]
+            self.table_row[table] = pdb.list_with_keys(
+                table, list(row_class._key_indices) + [column])
+            document_class = self.table_document[table]
+            self.table_document[table] = pdb.list_with_keys(
+                table, list(document_class._key_indices) + [field])
+            self.field_column.setdefault(collection, {})[field] = column
+            self.field_type.setdefault(collection, {})[field] = type
+            self.field_row.setdefault(collection, OrderedDict())[field] = \
+                self.table_row[FIELD_TABLE](field_name=field,
+                                            collection_name=collection,
+                                            field_type=type,
+                                            description=description,
+                                            has_index=(1 if index else 0),
+                                            column=column)
+            if index:
+                sql = 'CREATE INDEX [{0}_{1}] ON [{0}] ([{1}])'.format(table, column)
+                self.cursor.execute(sql)
+            if type.startswith('list_'):
+                sql = 'CREATE TABLE [list_{0}_{1}] (list_id TEXT NOT NULL, i INT, value {2})'.format(table, column, self.sql_type(type[5:]))
+                self.cursor.execute(sql)
+                sql = 'CREATE INDEX [list_{0}_{1}_id] ON [list_{0}_{1}] (list_id)'.format(table, column)
+                self.cursor.execute(sql)
+                sql = 'CREATE INDEX [list_{0}_{1}_i] ON [list_{0}_{1}] (i ASC)'.format(table, column)
+                self.cursor.execute(sql)
+                if index:
+                    # Index of the list items used to select the documents
+                    # containing a value
+                    sql = 'CREATE INDEX [list_{0}_{1}_value] ON [list_{0}_{1}] (value)'.format(table, column)
+                    self.cursor.execute(sql)
     
     def add_document(self, collection, document, create_missing_fields):
+        self.add_documents(collection, [document], create_missing_fields)
+
+    def add_documents(self, collection, documents, create_missing_fields):
         table = self.collection_table[collection]
         primary_key = self.collection_primary_key[collection]
-        document_id = document[primary_key]
-        lists = []
-        column_values = {}
-        for field, value in document.items():
-            field_type = self.field_type[collection].get(field)
-            if field_type is None:
+        # add_fields() updates these dictionaries in place
+        field_types = self.field_type[collection]
+        field_columns = self.field_column[collection]
+        
+        # Missing fields are all created at once before inserting documents
+        new_fields = OrderedDict()
+        for document in documents:
+            for field, value in document.items():
+                if field in field_types or field in new_fields:
+                    continue
                 if not create_missing_fields:
                     raise ValueError('Collection {0} has no field {1}'
                                     .format(collection, field))
@@ -336,77 +501,87 @@ class SQLiteEngine(Engine):
                                     .format(collection,
                                             field,
                                             type(value)))
-                self.add_field(collection, field, field_type,
-                            description=None, index=False)
-            column = self.field_column[collection][field]
-            if isinstance(value, list):
-                list_table = 'list_%s_%s' % (table, column)
-                list_id = document_id
-                column_values[column] = self.list_hash(value)
-                sql = 'INSERT INTO [%s] (list_id, i, value) VALUES (?, ?, ?)' % list_table
-                sql_params = [
-                    [list_id,
-                     i,
-                     self.python_to_column(field_type[5:], value[i])]
-                     for i in range(len(value))]
-                lists.append((sql, sql_params))
+                new_fields[field] = field_type
+        if new_fields:
+            self.add_fields([(collection, field, field_type, None, False)
+                             for field, field_type in new_fields.items()])
+        
+        # Consecutive documents having the same columns are inserted with
+        # a single executemany. Values of list fields are grouped per
+        # list table.
+        batches = []
+        lists = {}
+        for document in documents:
+            document_id = document[primary_key]
+            column_values = {}
+            for field, value in document.items():
+                field_type = field_types[field]
+                column = field_columns[field]
+                if isinstance(value, list):
+                    list_table = 'list_%s_%s' % (table, column)
+                    column_values[column] = self.list_hash(value)
+                    lists.setdefault(list_table, []).extend(
+                        [document_id, i, v]
+                        for i, v in enumerate(self.list_to_column(field_type[5:], value)))
+                else:
+                    column_values[column] = self.python_to_column(field_type, value)
+            columns = tuple(sorted(column_values))
+            row = [column_values[i] for i in columns]
+            if batches and batches[-1][0] == columns:
+                batches[-1][1].append(row)
             else:
-                column_values[column] = self.python_to_column(field_type, value)
+                batches.append((columns, [row]))
         
-        sql = 'INSERT INTO [%s] (%s) VALUES (%s)' % (
-            table,
-            ','.join('[%s]' % i for i in column_values.keys()),
-            ','.join('?' for i in column_values))
-        try:
-            self.cursor.execute(sql, list(column_values.values()))
-        except sqlite3.IntegrityError as e:
-            raise ValueError(str(e))
-        for sql, sql_params in lists:
+        for columns, rows in batches:
+            sql = 'INSERT INTO [%s] (%s) VALUES (%s)' % (
+                table,
+                ','.join('[%s]' % i for i in columns),
+                ','.join('?' for i in columns))
+            try:
+                self.cursor.executemany(sql, rows)
+            except sqlite3.IntegrityError as e:
+                raise ValueError(str(e))
+        for list_table, sql_params in lists.items():
+            sql = 'INSERT INTO [%s] (list_id, i, value) VALUES (?, ?, ?)' % list_table
             self.cursor.executemany(sql, sql_params)
             
     def has_field(self, collection, field):
         return self.field_column.get(collection, {}).get(field) is not None
     
     def field(self, collection, field):
-        row_class = self.table_row[FIELD_TABLE]
-        sql = 'SELECT %s FROM [%s] WHERE collection_name = ? AND field_name = ?' % (
-            ','.join('[%s]' % i for i in row_class._key_indices),
-            FIELD_TABLE)
-        self.cursor.execute(sql, [collection, field])
-        row = self.cursor.fetchone()
-        if row is not None:
-            return row_class(*row)
-        return None
+        return self.field_row.get(collection, {}).get(field)
 
     def fields(self, collection=None):
-        row_class = self.table_row[FIELD_TABLE]
-        sql = 'SELECT %s FROM [%s]' % (
-            ','.join('[%s]' % i for i in row_class._key_indices),
-            FIELD_TABLE)
         if collection is None:
-            data = []
+            for field_rows in list(self.field_row.values()):
+                for row in list(field_rows.values()):
+                    yield row
         else:
-            sql += ' WHERE collection_name = ?'
-            data = [collection]
-        self.cursor.execute(sql, data)
-        for row in self.cursor.fetchall():
-            yield row_class(*row)
+            for row in list(self.field_row.get(collection, {}).values()):
+                yield row
     
     def remove_fields(self, collection, fields):
         table = self.collection_table[collection]
+        self.filter_where.clear()
+        primary_key = self.collection_primary_key[collection]
         exclude_fields = set(fields)
         new_columns = []
+        removed_columns = []
         indices = []
         for field in self.fields(collection):
             if field.field_name not in exclude_fields:
-                new_columns.append((field.column,
-                                    self.sql_type(field.field_type)))
-                if field.has_index:
-                    indices.append(field.column)
+                if field.field_name == primary_key:
+                    new_columns.append((field.column, 'TEXT PRIMARY KEY'))
+                else:
+                    new_columns.append((field.column,
+                                        self.sql_type(field.field_type)))
+                    if field.has_index:
+                        indices.append(field.column)
             else:
-                self.table_row[table]._delete_key(field.column)
-                self.table_document[table]._delete_key(field.field_name)
                 del self.field_column[collection][field.field_name]
+                del self.field_type[collection][field.field_name]
+                del self.field_row[collection][field.field_name]
+                removed_columns.append(field.column)
                 sql = 'DELETE FROM [%s] WHERE collection_name = ? AND field_name = ?' % FIELD_TABLE
                 self.cursor.execute(sql, [collection, field.field_name])
                 if field.field_type.startswith('list_'):
@@ -414,14 +589,34 @@ class SQLiteEngine(Engine):
                     list_table = 'list_%s_%s' % (table, column)
                     sql = 'DROP TABLE [%s]' % list_table
                     self.cursor.execute(sql)
+        # Row classes are shared with the documents already returned, they
+        # are replaced instead of being modified.
+        self.table_row[table] = pdb.list_with_keys(
+            table, [i for i in self.table_row[table]._key_indices
+                    if i not in removed_columns])
+        self.table_document[table] = pdb.list_with_keys(
+            table, [i for i in self.table_document[table]._key_indices
+                    if i not in exclude_fields])
+        if _has_drop_column and primary_key not in exclude_fields:
+            # Indexed columns cannot be dropped
+            self.cursor.execute('PRAGMA index_list([%s])' % table)
+            for index in [i[1] for i in self.cursor.fetchall()]:
+                self.cursor.execute('PRAGMA index_info([%s])' % index)
+                if any(i[2] in removed_columns for i in self.cursor.fetchall()):
+                    sql = 'DROP INDEX [%s]' % index
+                    self.cursor.execute(sql)
+            for column in removed_columns:
+                sql = 'ALTER TABLE [%s] DROP COLUMN [%s]' % (table, column)
+                self.cursor.execute(sql)
+            return
+        
+        # Older SQLite versions require to copy the table. CREATE TABLE AS
+        # SELECT is not used because it does not keep the primary key
+        # constraint.
         tmp_table = '_' + str(uuid.uuid4())
         sql = 'CREATE TABLE [%s] (%s)' % (tmp_table,
                                           ','.join('[%s] %s' % (i, j) for i, j in new_columns))
         self.cursor.execute(sql)
-        for column in indices:
-            sql = 'CREATE INDEX [{0}_{1}] ON [{0}] ([{1}])'.format(tmp_table, column)
-            self.cursor.execute(sql)
-        self.cursor.execute('PRAGMA table_info([%s])' % table)
         sql = 'INSERT INTO [%s] SELECT %s FROM [%s]' % (
             tmp_table,
             ','.join('[%s]' % i[0] for i in new_columns),
@@ -435,14 +630,19 @@ class SQLiteEngine(Engine):
         self.cursor.execute(sql)
         sql = 'PRAGMA foreign_keys=ON'
         self.cursor.execute(sql)
+        # Indices are created once the data is copied and with the same
+        # name as in add_fields()
+        for column in indices:
+            sql = 'CREATE INDEX [{0}_{1}] ON [{0}] ([{1}])'.format(table, column)
+            self.cursor.execute(sql)
     
-    # Some types (e.g. time, date and datetime) cannot be
-    # serialized/deserialized into string with repr/ast.literal_eval.
-    # This is a problem for storing the corresponding list_columns in
-    # database. For the list types with this problem, we record in the
-    # following dictionaries the functions that must be used to serialize
-    # (in _list_item_to_string) and deserialize (in _string_to_list_item)
-    # the list items.
+    # Some types (e.g. time, date, datetime, boolean and json) cannot be
+    # stored directly in SQLite. For these types, we record in the
+    # following dictionaries the functions that must be used to convert
+    # values to (in _python_to_sql_data) and from (in _sql_to_python)
+    # database columns. Values of json fields and json list items are
+    # serialized with the json module (C accelerated) and the functions
+    # are bound once at class creation.
     _python_to_sql_data = {
         pdb.FIELD_TYPE_DATE: lambda x: x.isoformat() if x is not None else x,
         pdb.FIELD_TYPE_DATETIME:
@@ -452,11 +652,11 @@ class SQLiteEngine(Engine):
     }
 
     _sql_to_python = {
-        pdb.FIELD_TYPE_DATE: lambda x: dateutil.parser.parse(x).date(),
-        pdb.FIELD_TYPE_DATETIME: lambda x: dateutil.parser.parse(x),
-        pdb.FIELD_TYPE_TIME: lambda x: dateutil.parser.parse(x).time(),
-        pdb.FIELD_TYPE_BOOLEAN: lambda x: bool(x),
-        pdb.FIELD_TYPE_JSON: lambda x: json.loads(x),
+        pdb.FIELD_TYPE_DATE: _from_isoformat(datetime.date, lambda x: x.date()),
+        pdb.FIELD_TYPE_DATETIME: _from_isoformat(datetime.datetime, lambda x: x),
+        pdb.FIELD_TYPE_TIME: _from_isoformat(datetime.time, lambda x: x.time()),
+        pdb.FIELD_TYPE_BOOLEAN: bool,
+        pdb.FIELD_TYPE_JSON: json.loads,
     }
 
     @staticmethod
@@ -473,6 +673,22 @@ class SQLiteEngine(Engine):
         else:
             return value
 
+    @staticmethod
+    def list_to_column(item_type, value):
+        """
+        Converts the items of a python list into suitable values to put in
+        the value column of a list table. The converter is looked up once
+        for the whole list.
+        """
+        converter = SQLiteEngine._python_to_sql_data.get(item_type)
+        if converter is not None:
+            return list(map(converter, value))
+        elif item_type == pdb.FIELD_TYPE_JSON:
+            dumps = json.dumps
+            return [dumps(i) if isinstance(i, dict) else i for i in value]
+        else:
+            return value
+
     @staticmethod
     def column_to_python(field_type, value):
         if value is None:
@@ -485,62 +701,110 @@ class SQLiteEngine(Engine):
 
     def has_document(self, collection, document_id):
         table = self.collection_table[collection]
-        primary_key = self.collection_primary_key[collection]
-        pk_column = self.field_column[collection][primary_key]
+        pk_column = self.collection_pk_column[collection]
         sql = 'SELECT COUNT(*) FROM [%s] WHERE [%s] = ?' % (table, pk_column)
         self.cursor.execute(sql, [document_id])
         r = self.cursor.fetchone()
         return bool(r[0])
 
 
+    def document_ids(self, collection):
+        table = self.collection_table[collection]
+        pk_column = self.collection_pk_column[collection]
+        sql = 'SELECT [%s] FROM [%s]' % (pk_column, table)
+        self.cursor.execute(sql)
+        return [i[0] for i in self.cursor]
+
     def _select_documents(self, collection, where, where_data,
                           fields=None, as_list=False):
         table = self.collection_table[collection]
-        primary_key = self.collection_primary_key[collection]
-        pk_column = self.field_column[collection][primary_key]
+        pk_column = self.collection_pk_column[collection]
         row_class = self.table_row[table]
+        field_types = self.field_type[collection]
+        field_columns = self.field_column[collection]
         if fields:
             selected_fields = fields
-            columns = [self.field_column[collection][i] for i in fields]
+            columns = [field_columns[i] for i in fields]
         else:
-            selected_fields = list(self.table_document[table].keys())
+            selected_fields = list(self.table_document[table]._key_indices)
             columns = list(row_class._key_indices)
         sql = 'SELECT %s FROM [%s]' % (
             ','.join('[%s]' % i for i in [pk_column] + columns),
             table)
         if where:
             sql += ' WHERE %s' % where
+        # Conversion of each selected column is resolved once per query.
+        # For list fields, the list table column is also given.
+        converters = []
+        for field in selected_fields:
+            field_type = field_types[field]
+            if field_type.startswith('list_'):
+                converters.append((field_columns[field],
+                                   self._sql_to_python.get(field_type[5:])))
+            else:
+                converters.append((None, self._sql_to_python.get(field_type)))
+        # A single row class is used for all the documents of the query
+        if fields:
+            document_class = pdb.list_with_keys(table, selected_fields)
+        else:
+            document_class = self.table_document[table]
+        # All rows are fetched before yielding documents because the caller
+        # may modify the database during the iteration
         self.cursor.execute(sql, where_data)
-        for row in self.cursor.fetchall():
-            document_id = row[0]
-            values = []
-            for field, sql_value in zip(selected_fields, row[1:]):
-                field_type = self.field_type[collection][field]
-                if field_type.startswith('list_'):
-                    item_type = field_type[5:]
-                    column = self.field_column[collection][field]
-                    list_hash = sql_value
-                    if list_hash is None:
-                        values.append(None)
-                    else:
-                        sql = 'SELECT value FROM [list_{0}_{1}] WHERE list_id = ? ORDER BY i'.format(table, column)
-                        self.cursor.execute(sql, [document_id])
-                        values.append([self.column_to_python(item_type,i[0]) for i in self.cursor])
-                else:
-                    values.append(self.column_to_python(field_type, sql_value))
-            if as_list:
-                yield values
+        rows = self.cursor.fetchall()
+        
+        if not rows:
+            return
+        
+        # Items of list fields are read with one query per list field for
+        # all the selected documents.
+        list_values = {}
+        for list_column, converter in converters:
+            if list_column is None or list_column in list_values:
+                continue
+            sql = 'SELECT list_id, value FROM [list_%s_%s]' % (table, list_column)
+            data = []
+            if where:
+                sql += ' WHERE list_id IN (SELECT [%s] FROM [%s] WHERE %s)' % (pk_column, table, where)
+                data = where_data
+            sql += ' ORDER BY list_id, i'
+            items = {}
+            self.cursor.execute(sql, data)
+            if converter is None:
+                # Numeric and string items are used as returned by sqlite3
+                for list_id, value in self.cursor:
+                    items.setdefault(list_id, []).append(value)
             else:
-                if fields:
-                    result = pdb.DictList(selected_fields, values)
-                else:
-                    result = self.table_document[table](*values)
-                yield result
+                for list_id, value in self.cursor:
+                    if value is not None:
+                        value = converter(value)
+                    items.setdefault(list_id, []).append(value)
+            list_values[list_column] = items
+        
+        # For each column: the items of the list field (None for other
+        # fields) and the converter. Columns with neither are used as
+        # returned by sqlite3.
+        column_converters = [(list_values[list_column] if list_column is not None else None,
+                              converter)
+                             for list_column, converter in converters]
+        if all(items is None and converter is None
+               for items, converter in column_converters):
+            for row in rows:
+                values = list(row[1:])
+                yield values if as_list else document_class(*values)
+            return
+        for row in rows:
+            document_id = row[0]
+            values = [None if sql_value is None
+                      else items.get(document_id, []) if items is not None
+                      else converter(sql_value) if converter is not None
+                      else sql_value
+                      for (items, converter), sql_value in zip(column_converters, row[1:])]
+            yield values if as_list else document_class(*values)
 
     def document(self, collection, document_id,
                  fields=None, as_list=False):
-        primary_key = self.collection_primary_key[collection]
-        pk_column = self.field_column[collection][primary_key]
+        pk_column = self.collection_pk_column[collection]
         where = '[%s] = ?' % pk_column
         where_data = [document_id]
         
@@ -553,8 +817,7 @@ class SQLiteEngine(Engine):
     def has_value(self, collection, document_id, field):
         table = self.collection_table.get(collection)
         if table is not None:
-            primary_key = self.collection_primary_key[collection]
-            pk_column = self.field_column[collection][primary_key]
+            pk_column = self.collection_pk_column[collection]
             column = self.field_column[collection].get(field)
             if column is not None:
                 sql = 'SELECT [%s] FROM [%s] WHERE [%s] = ?' % (column, table,
@@ -570,41 +833,50 @@ class SQLiteEngine(Engine):
         primary_key = self.collection_primary_key[collection]
         if primary_key in values:
             raise ValueError('Cannot modify document id "%s" of collection %s' % (primary_key, collection))
-        pk_column = self.field_column[collection][primary_key]
+        pk_column = self.collection_pk_column[collection]
+        field_types = self.field_type[collection]
+        field_columns = self.field_column[collection]
         column_values = []
         columns = []
+        lists = []
         for field, value in values.items():
-            column = self.field_column[collection][field]
+            column = field_columns[field]
             columns.append(column)
-            field_type = self.field_type[collection][field]
+            field_type = field_types[field]
             if field_type.startswith('list_'):
-                list_table = 'list_%s_%s' % (table, column)
                 column_values.append(self.list_hash(value))
-                sql = 'DELETE FROM [%s] WHERE list_id = ?' % list_table
-                self.cursor.execute(sql, [document_id])
-                sql = 'INSERT INTO [%s] (list_id, i, value) VALUES (?, ?, ?)' % list_table
-                if value is None:
-                    value = []
-                sql_params = [[document_id, 
-                            i,
-                            self.python_to_column(field_type[5:], value[i])]
-                            for i in range(len(value))]
-                self.cursor.executemany(sql, sql_params)
-                # column_value = repr(value)
+                lists.append((column, field_type[5:], value))
             else:
                 column_values.append(self.python_to_column(field_type, value))
 
-        sql = 'UPDATE [%s] SET %s WHERE [%s] = ?' % (
-            table,
-            ', '.join(['[%s] = ?' % c for c in columns]),
-            pk_column)
-        self.cursor.execute(sql, column_values + [document_id])
+        # The document existence is checked with the number of updated rows
+        if columns:
+            sql = 'UPDATE [%s] SET %s WHERE [%s] = ?' % (
+                table,
+                ', '.join(['[%s] = ?' % c for c in columns]),
+                pk_column)
+            self.cursor.execute(sql, column_values + [document_id])
+            exists = self.cursor.rowcount > 0
+        else:
+            exists = self.has_document(collection, document_id)
+        if not exists:
+            raise ValueError(
+                "The document with the name {0} does not exist in the collection {1}".format(document_id, collection))
+
+        for column, item_type, value in lists:
+            list_table = 'list_%s_%s' % (table, column)
+            sql = 'DELETE FROM [%s] WHERE list_id = ?' % list_table
+            self.cursor.execute(sql, [document_id])
+            if value:
+                sql = 'INSERT INTO [%s] (list_id, i, value) VALUES (?, ?, ?)' % list_table
+                sql_params = [[document_id, i, v]
+                              for i, v in enumerate(self.list_to_column(item_type, value))]
+                self.cursor.executemany(sql, sql_params)
 
     def remove_value(self, collection, document_id, field):
         table = self.collection_table[collection]
         column = self.field_column[collection][field]
-        primary_key = self.collection_primary_key[collection]
-        pk_column = self.field_column[collection][primary_key]
+        pk_column = self.collection_pk_column[collection]
         field_type = self.field_type[collection][field]
         if field_type.startswith('list_'):
             list_table = 'list_%s_%s' % (table, column)
@@ -620,16 +892,21 @@ class SQLiteEngine(Engine):
 
     def remove_document(self, collection, document_id):
         table = self.collection_table[collection]
-        primary_key = self.collection_primary_key[collection]
-        pk_column = self.field_column[collection][primary_key]
-        document = self.document(collection, document_id)
-        for field in self.fields(collection):
-            if field.field_type.startswith('list_') and document[field.field_name]:
-                self.remove_value(collection, document_id, field.field_name)
+        pk_column = self.collection_pk_column[collection]
+        # The document existence is checked with the number of deleted rows
         sql = 'DELETE FROM [%s] WHERE [%s] = ?' % (
             table,
             pk_column)
         self.cursor.execute(sql, [document_id])
+        if self.cursor.rowcount == 0:
+            raise ValueError(
+                "The document with the name {0} does not exist in the collection {1}".format(document_id, collection))
+        field_columns = self.field_column[collection]
+        for field, field_type in self.field_type[collection].items():
+            if field_type.startswith('list_'):
+                sql = 'DELETE FROM [list_%s_%s] WHERE list_id = ?' % (
+                    table, field_columns[field])
+                self.cursor.execute(sql, [document_id])
         
     def parse_filter(self, collection, filter):
         """
@@ -645,24 +922,50 @@ class SQLiteEngine(Engine):
 
         """
         if filter is None:
-            query = None
-        else:
-            tree = filter_parser().parse(filter)
-            query = FilterToSqliteQuery(self, collection).transform(tree)
-        return (collection, query)
+            return (collection, None)
+        # The SQL WHERE clause is built once per filter and collection and
+        # reused until a collection or a field is removed or the caches
+        # are reloaded
+        key = (collection, filter)
+        try:
+            where = self.filter_where[key]
+        except KeyError:
+            tree = parse_filter_tree(filter)
+            try:
+                query = FilterToSqliteQuery(self, collection).transform(tree)
+            except VisitError as e:
+                # Lark wraps the errors raised while transforming the tree,
+                # invalid filters (e.g. unknown field) raise ValueError
+                if isinstance(e.orig_exc, ValueError):
+                    raise e.orig_exc
+                raise
+            if query is None:
+                where = None
+            else:
+                where = ' '.join(query)
+            if len(self.filter_where) >= 512:
+                self.filter_where.clear()
+            self.filter_where[key] = where
+        return (collection, where)
 
 
     def filter_documents(self, parsed_filter, fields=None, as_list=False):
-        collection, where_filter = parsed_filter
-        if where_filter is None:
-            where = None
-        else:
-            where = ' '.join(where_filter)
+        collection, where = parsed_filter
         where_data = []
         for doc in self._select_documents(collection, where, where_data,
                                           fields=fields, as_list=as_list):
             yield doc
 
+    def filter_document_ids(self, parsed_filter):
+        collection, where = parsed_filter
+        table = self.collection_table[collection]
+        pk_column = self.collection_pk_column[collection]
+        sql = 'SELECT [%s] FROM [%s]' % (pk_column, table)
+        if where:
+            sql += ' WHERE %s' % where
+        self.cursor.execute(sql)
+        return [i[0] for i in self.cursor]
+
 
 class FilterToSqliteQuery(FilterToQuery):
     '''
@@ -722,24 +1025,24 @@ class FilterToSqliteQuery(FilterToQuery):
         cvalue = self.get_column_value(value)
         list_column = self.get_column(list_field)
         list_table = 'list_%s_%s' % (self.table, list_column)
-        primary_key_column = self.engine.primary_key(self.collection)
-        pk_column = self.engine.field_column[
-            self.collection][primary_key_column]
+        pk_column = self.engine.collection_pk_column[self.collection]
 
+        # The subquery does not depend on the document, it is evaluated
+        # once (using the items index if the field has one) instead of
+        # once per document.
         where = ('[{0}] IS NOT NULL AND '
-                 '{1} IN (SELECT value FROM {2} '
-                 'WHERE list_id = [{3}])').format(list_column,
-                                                  cvalue,
-                                                  list_table,
-                                                  pk_column)
+                 '[{3}] IN (SELECT list_id FROM {2} '
+                 'WHERE value = {1})').format(list_column,
+                                              cvalue,
+                                              list_table,
+                                              pk_column)
         return [where]
 
     def build_condition_field_in_list_field(self, field, list_field):
         column = self.get_column(field)
         list_column = self.get_column(list_field)
         list_table = 'list_%s_%s' % (self.table, list_column)
-        primary_key_column = self.engine.primary_key(self.collection)
-        pk_column = self.engine.field_column[self.collection][primary_key_column]
+        pk_column = self.engine.collection_pk_column[self.collection]
 
         where = ('[{0}] IS NOT NULL AND '
                  '[{1}] IN (SELECT value FROM {2} '
@@ -779,6 +1082,34 @@ class FilterToSqliteQuery(FilterToQuery):
                               field_pattern % self.get_column(right_field))
         return [where]
     
+    # Patterns without wildcard except a leading and/or trailing '%'. Prefix
+    # patterns are left to LIKE that can use an index for them.
+    suffix_pattern = re.compile(r'^%([^%_]+)$')
+    infix_pattern = re.compile(r'^%([^%_]+)%$')
+
+    def build_condition_like(self, column, pattern):
+        '''
+        Builds a condition equivalent to "column LIKE pattern" that avoids
+        the generic LIKE matching for patterns only looking for a suffix
+        or a substring. Returns None for other patterns.
+
+        :param column: SQL expression of the matched column
+        :param pattern: LIKE pattern (str)
+        '''
+        match = self.suffix_pattern.match(pattern)
+        if match:
+            suffix = match.group(1)
+            if isinstance(suffix, bytes):
+                # Python 2: substr() counts characters, not bytes
+                suffix = suffix.decode('utf-8')
+            return 'substr(%s, %d) = %s' % (column, -len(suffix),
+                                            self.get_column_value(match.group(1)))
+        match = self.infix_pattern.match(pattern)
+        if match:
+            return 'instr(%s, %s) > 0' % (column,
+                                          self.get_column_value(match.group(1)))
+        return None
+
     def build_condition_field_op_value(self, field, operator_str, value):
         if isinstance(value, list):
             if operator_str in self.no_list_operator:
@@ -791,6 +1122,10 @@ class FilterToSqliteQuery(FilterToQuery):
         else:
             field_pattern = '[%s]'
         sql_operator = self.sql_operators.get(operator_str, operator_str)
+        if operator_str in ('like', 'ilike') and isinstance(value, six.string_types):
+            where = self.build_condition_like(field_pattern % self.get_column(field), value)
+            if where is not None:
+                return [where]
         where = '%s %s %s' % (field_pattern % self.get_column(field),
                               sql_operator,
                               self.get_column_value(value))
@@ -801,7 +1136,7 @@ class FilterToSqliteQuery(FilterToQuery):
         if isinstance(value, list):
             if operator_str in self.no_list_operator:
                 raise ValueError('operator %s cannot be used with value of list type' % operator_str)
-            value = self.list_hash(value)
+            value = self.engine.list_hash(value)
         if operator_str == 'ilike':
             field_pattern = 'UPPER([%s])'
             if isinstance(value, six.string_types):
@@ -819,5 +1154,25 @@ class FilterToSqliteQuery(FilterToQuery):
             return ['0']
         return ['NOT', '(' ] + condition + [')']
     
+    @staticmethod
+    def condition_cost(condition):
+        '''
+        Rough estimate of the cost of evaluating a condition for one
+        document. Conditions using a subquery on a list table are the most
+        expensive, then pattern matching with LIKE.
+        '''
+        cost = 0
+        for part in condition:
+            if '(SELECT ' in part:
+                return 2
+            elif ' like ' in part.lower():
+                cost = 1
+        return cost
+
     def build_condition_combine_conditions(self, left_condition, operator_str, right_condition):
+        # SQLite stops evaluating AND and OR as soon as the result is
+        # known, therefore the cheapest condition is put first. Both
+        # operators are commutative so this does not change the result.
+        if self.condition_cost(right_condition) < self.condition_cost(left_condition):
+            left_condition, right_condition = right_condition, left_condition
         return ['('] + left_condition + [')', operator_str, '('] + right_condition + [')']
@@ -1,13 +1,11 @@
 import ast
+from collections import OrderedDict
 import datetime
 import operator
-import types
 
-import dateutil.parser
 import six
 from lark import Lark, Transformer
 
-import populse_db
 from populse_db.database import ListWithKeys
 
 # The grammar (in Lark format) used to parse filter strings:
@@ -89,9 +87,10 @@ ESCAPED_STRING : "\\"" _STRING_ESC_INNER "\\""
 %ignore WS
 '''
 
-# The instance of the grammar parser is created only once
-# then stored in _grammar_parser for later reuse
+# The instances of the grammar parsers are created only once
+# then stored in _grammar_parser and _literal_parser for later reuse
 _grammar_parser = None
+_literal_parser = None
 
 
 def filter_parser():
@@ -104,15 +103,42 @@ def filter_parser():
     return _grammar_parser
 
 
+# Parse trees of the most recently used filter strings. The tree of a filter
+# does not depend on the collection or on the database schema, fields are
+# only resolved when the tree is transformed into a query.
+_filter_trees = OrderedDict()
+_filter_trees_max_size = 256
+
+
+def parse_filter_tree(filter):
+    '''
+    :return: The Lark parse tree of a filter string. Trees are cached for
+       the last used filter strings.
+    '''
+    tree = _filter_trees.pop(filter, None)
+    if tree is None:
+        tree = filter_parser().parse(filter)
+        if len(_filter_trees) >= _filter_trees_max_size:
+            # The least recently used tree is the first one
+            _filter_trees.pop(next(iter(_filter_trees)), None)
+    # Trees are moved to the end at each use (OrderedDict.move_to_end()
+    # does not exist in Python 2)
+    _filter_trees[filter] = tree
+    return tree
+
+
 def literal_parser():
     '''
     This is used to test literals parsing
 
-    :return: An instance of Lark grammar parser for parsing only a literal
-       value (int, string, list, date, etc.) from a filter expression. This
-       is used for testing the parsing of these literals.
+    :return: A singleton instance of Lark grammar parser for parsing only a
+       literal value (int, string, list, date, etc.) from a filter expression.
+       This is used for testing the parsing of these literals.
     '''
-    return Lark(filter_grammar, parser='lalr', start='literal')
+    global _literal_parser
+    if _literal_parser is None:
+        _literal_parser = Lark(filter_grammar, parser='lalr', start='literal')
+    return _literal_parser
 
 
 class FilterToQuery(Transformer):
@@ -240,13 +266,17 @@ class FilterToQuery(Transformer):
     def number(self, items):
         return float(items[0])
 
+    # dateutil is only imported when a filter contains a date literal
     def date(self, items):
+        import dateutil.parser
         return dateutil.parser.parse(items[0]).date()
 
     def time(self, items):
+        import dateutil.parser
         return dateutil.parser.parse(items[0]).time()
 
     def datetime(self, items):
+        import dateutil.parser
         return dateutil.parser.parse(items[0])
 
     def keyword_literal(self, items):
@@ -57,7 +57,8 @@ CLASSIFIERS = CLASSIFIERS
 PLATFORMS = 'OS Independent'
 REQUIRES = [
     'python-dateutil',
-    'lark <1.0.0'
+    'lark <1.0.0',
+    'six',
 ]
 EXTRA_REQUIRES = {
     'doc': [
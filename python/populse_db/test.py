@@ -1,12 +1,36 @@
 from __future__ import print_function
 
+import contextlib
 import datetime
+import itertools
 import os
 import shutil
+import sqlite3
 import tempfile
 import unittest
 import sys
 
+try:
+    from importlib.util import find_spec
+except ImportError:
+    # Python 2
+    from pkgutil import find_loader as find_spec
+
+if hasattr(unittest.TestCase, 'subTest'):
+    def sub_test(test_case, **params):
+        return test_case.subTest(**params)
+else:
+    # Python 2: the test stops at the first failing sub-test. The
+    # parameters of the sub-test are added to the error message.
+    @contextlib.contextmanager
+    def sub_test(test_case, **params):
+        try:
+            yield
+        except Exception as e:
+            e.args = ('While testing %s\n%s' % (
+                ', '.join('%s=%r' % i for i in sorted(params.items())), e),)
+            raise
+
 from populse_db.database import Database, FIELD_TYPE_STRING, FIELD_TYPE_FLOAT, FIELD_TYPE_TIME, FIELD_TYPE_DATETIME, \
     FIELD_TYPE_LIST_INTEGER, FIELD_TYPE_BOOLEAN, FIELD_TYPE_LIST_BOOLEAN, FIELD_TYPE_INTEGER, FIELD_TYPE_LIST_DATE, \
     FIELD_TYPE_LIST_TIME, FIELD_TYPE_LIST_DATETIME, FIELD_TYPE_LIST_STRING, FIELD_TYPE_LIST_FLOAT, DatabaseSession, \
@@ -15,86 +39,822 @@ from populse_db.filter import literal_parser, FilterToQuery
 
 do_tests = True
 
+# Document with one value of each field type, built once for all the tests
+_now = datetime.datetime.now()
+BASE_DOC = {
+    'string': 'string',
+    'int': 1,
+    'float': 1.4,
+    'boolean': True,
+    'datetime': _now,
+    'date': _now.date(),
+    'time': _now.time(),
+    'dict': {
+        'string': 'string',
+        'int': 1,
+        'float': 1.4,
+        'boolean': True,
+    }
+}
+# BASE_DOC with a one item list field for each value
+DOC_WITH_LISTS = dict(BASE_DOC)
+DOC_WITH_LISTS.update(('list_%s' % k, [v]) for k, v in BASE_DOC.items())
+DOC_WITH_LISTS['index'] = 'test'
+
+# Filters tested by test_filters with the names of the documents they select
+FILTER_CASES = (
+    ('format == "NIFTI"',
+     frozenset([
+         '/xyz_1899.nii',
+         '/xyz_2018.nii',
+         '/abc_2018.nii',
+         '/bcd_1899.nii',
+         '/bcd_2018.nii',
+         '/def_1899.nii',
+         '/abc_1981.nii',
+         '/def_2018.nii',
+         '/def_1981.nii',
+         '/bcd_1981.nii',
+         '/abc_1899.nii',
+         '/xyz_1981.nii'
+     ])
+     ),
+
+    ('"b" IN strings',
+     frozenset([
+         '/bcd_2018.mgz',
+         '/abc_1899.mgz',
+         '/abc_1899.dcm',
+         '/bcd_1981.dcm',
+         '/abc_1981.dcm',
+         '/bcd_1981.mgz',
+         '/bcd_1899.mgz',
+         '/abc_1981.mgz',
+         '/abc_2018.mgz',
+         '/abc_2018.dcm',
+         '/bcd_2018.dcm',
+         '/bcd_1899.dcm',
+         '/abc_2018.nii',
+         '/bcd_1899.nii',
+         '/abc_1981.nii',
+         '/bcd_1981.nii',
+         '/abc_1899.nii',
+         '/bcd_2018.nii',
+         '/abc_1899.none',
+         '/bcd_1899.none',
+         '/bcd_1981.none',
+         '/abc_2018.none',
+         '/bcd_2018.none',
+         '/abc_1981.none'
+     ])
+     ),
+
+    ('(format == "NIFTI" OR NOT format == "DICOM")',
+     frozenset([
+         '/xyz_1899.nii',
+         '/xyz_1899.mgz',
+         '/bcd_2018.mgz',
+         '/bcd_1899.nii',
+         '/bcd_2018.nii',
+         '/def_1899.nii',
+         '/bcd_1981.mgz',
+         '/abc_1981.nii',
+         '/def_2018.mgz',
+         '/abc_1899.nii',
+         '/def_1899.mgz',
+         '/xyz_1899.none',
+         '/abc_2018.nii',
+         '/def_1899.none',
+         '/bcd_1899.mgz',
+         '/def_2018.nii',
+         '/abc_1981.mgz',
+         '/abc_1899.none',
+         '/xyz_1981.mgz',
+         '/bcd_1981.nii',
+         '/xyz_1981.nii',
+         '/abc_2018.mgz',
+         '/xyz_2018.nii',
+         '/abc_1899.mgz',
+         '/def_1981.nii',
+         '/def_1981.mgz',
+         '/bcd_1899.none',
+         '/xyz_2018.mgz',
+         '/bcd_1981.none',
+         '/xyz_1981.none',
+         '/abc_1981.none',
+         '/def_2018.none',
+         '/xyz_2018.none',
+         '/abc_2018.none',
+         '/def_1981.none',
+         '/bcd_2018.none'
+     ])
+     ),
+
+    ('"a" IN strings',
+     frozenset([
+         '/abc_1899.none',
+         '/abc_1899.nii',
+         '/abc_2018.nii',
+         '/abc_1899.mgz',
+         '/abc_1899.dcm',
+         '/abc_1981.dcm',
+         '/abc_1981.nii',
+         '/abc_1981.mgz',
+         '/abc_2018.mgz',
+         '/abc_2018.dcm',
+         '/abc_2018.none',
+         '/abc_1981.none'
+     ])
+     ),
+
+    ('NOT "b" IN strings',
+     frozenset([
+         '/xyz_1899.nii',
+         '/xyz_2018.dcm',
+         '/def_1981.dcm',
+         '/xyz_2018.nii',
+         '/xyz_1981.dcm',
+         '/def_1899.none',
+         '/xyz_1899.dcm',
+         '/xyz_1981.nii',
+         '/def_1899.dcm',
+         '/def_1899.nii',
+         '/def_2018.mgz',
+         '/def_2018.nii',
+         '/xyz_1899.mgz',
+         '/def_2018.dcm',
+         '/def_1899.mgz',
+         '/def_1981.mgz',
+         '/xyz_1981.mgz',
+         '/xyz_2018.mgz',
+         '/xyz_1899.none',
+         '/def_1981.nii',
+         '/xyz_2018.none',
+         '/xyz_1981.none',
+         '/def_2018.none',
+         '/def_1981.none'
+     ])
+     ),
+    ('("a" IN strings OR NOT "b" IN strings)',
+     frozenset([
+         '/xyz_1899.nii',
+         '/xyz_1899.mgz',
+         '/def_1899.nii',
+         '/abc_1981.nii',
+         '/def_2018.mgz',
+         '/abc_1899.nii',
+         '/def_1899.mgz',
+         '/abc_2018.dcm',
+         '/xyz_1899.none',
+         '/xyz_2018.dcm',
+         '/def_1981.dcm',
+         '/abc_2018.nii',
+         '/def_1899.none',
+         '/abc_1981.dcm',
+         '/def_2018.nii',
+         '/abc_1981.mgz',
+         '/def_2018.dcm',
+         '/abc_1899.none',
+         '/xyz_1981.mgz',
+         '/xyz_1899.dcm',
+         '/abc_1899.dcm',
+         '/def_1899.dcm',
+         '/xyz_1981.nii',
+         '/abc_2018.mgz',
+         '/xyz_2018.nii',
+         '/abc_1899.mgz',
+         '/xyz_1981.dcm',
+         '/def_1981.nii',
+         '/def_1981.mgz',
+         '/xyz_2018.mgz',
+         '/xyz_1981.none',
+         '/abc_1981.none',
+         '/def_2018.none',
+         '/xyz_2018.none',
+         '/abc_2018.none',
+         '/def_1981.none'
+     ])
+     ),
+
+    ('format IN ["DICOM", "NIFTI"]',
+     frozenset([
+         '/xyz_1899.nii',
+         '/xyz_2018.dcm',
+         '/bcd_1899.nii',
+         '/def_1899.nii',
+         '/abc_1981.nii',
+         '/abc_1899.nii',
+         '/bcd_2018.nii',
+         '/abc_2018.dcm',
+         '/bcd_1899.dcm',
+         '/def_1981.dcm',
+         '/abc_2018.nii',
+         '/abc_1981.dcm',
+         '/bcd_2018.dcm',
+         '/def_2018.nii',
+         '/def_2018.dcm',
+         '/xyz_1899.dcm',
+         '/abc_1899.dcm',
+         '/def_1899.dcm',
+         '/bcd_1981.nii',
+         '/xyz_1981.nii',
+         '/xyz_2018.nii',
+         '/xyz_1981.dcm',
+         '/def_1981.nii',
+         '/bcd_1981.dcm',
+     ])
+     ),
+
+    ('(format == "NIFTI" OR NOT format == "DICOM") AND ("a" IN strings OR NOT "b" IN strings)',
+     frozenset([
+         '/abc_1899.none',
+         '/xyz_1899.mgz',
+         '/abc_1981.mgz',
+         '/abc_2018.nii',
+         '/xyz_1899.nii',
+         '/abc_1899.mgz',
+         '/def_1899.mgz',
+         '/def_1899.nii',
+         '/def_1899.none',
+         '/abc_1981.nii',
+         '/def_2018.nii',
+         '/xyz_2018.nii',
+         '/def_1981.nii',
+         '/abc_1899.nii',
+         '/xyz_1981.nii',
+         '/abc_2018.mgz',
+         '/def_1981.mgz',
+         '/xyz_2018.mgz',
+         '/xyz_1899.none',
+         '/def_2018.mgz',
+         '/xyz_1981.mgz',
+         '/xyz_1981.none',
+         '/abc_1981.none',
+         '/def_2018.none',
+         '/xyz_2018.none',
+         '/abc_2018.none',
+         '/def_1981.none'
+     ])
+     ),
+
+    ('format > "DICOM"',
+     frozenset([
+         '/xyz_1899.nii',
+         '/xyz_1899.mgz',
+         '/bcd_2018.mgz',
+         '/bcd_1899.nii',
+         '/bcd_2018.nii',
+         '/def_1899.nii',
+         '/bcd_1981.mgz',
+         '/abc_1981.nii',
+         '/def_2018.mgz',
+         '/abc_1899.nii',
+         '/def_1899.mgz',
+         '/abc_2018.nii',
+         '/def_2018.nii',
+         '/abc_1981.mgz',
+         '/xyz_1981.mgz',
+         '/bcd_1981.nii',
+         '/xyz_1981.nii',
+         '/abc_2018.mgz',
+         '/xyz_2018.nii',
+         '/abc_1899.mgz',
+         '/def_1981.nii',
+         '/def_1981.mgz',
+         '/bcd_1899.mgz',
+         '/xyz_2018.mgz'
+     ])
+     ),
+
+    ('format <= "DICOM"',
+     frozenset([
+         '/abc_1981.dcm',
+         '/def_1899.dcm',
+         '/abc_2018.dcm',
+         '/bcd_1899.dcm',
+         '/def_1981.dcm',
+         '/bcd_2018.dcm',
+         '/def_2018.dcm',
+         '/xyz_2018.dcm',
+         '/xyz_1899.dcm',
+         '/abc_1899.dcm',
+         '/xyz_1981.dcm',
+         '/bcd_1981.dcm',
+     ])
+     ),
+
+    ('format > "DICOM" AND strings != ["b", "c", "d"]',
+     frozenset([
+         '/xyz_1899.nii',
+         '/xyz_1899.mgz',
+         '/abc_1981.mgz',
+         '/abc_2018.nii',
+         '/xyz_2018.nii',
+         '/abc_1899.mgz',
+         '/def_1899.mgz',
+         '/def_1899.nii',
+         '/abc_1981.nii',
+         '/def_2018.nii',
+         '/def_1981.nii',
+         '/abc_1899.nii',
+         '/xyz_1981.nii',
+         '/abc_2018.mgz',
+         '/def_1981.mgz',
+         '/xyz_2018.mgz',
+         '/def_2018.mgz',
+         '/xyz_1981.mgz'
+     ])
+     ),
+
+    ('format <= "DICOM" AND strings == ["b", "c", "d"]',
+     frozenset([
+         '/bcd_2018.dcm',
+         '/bcd_1981.dcm',
+         '/bcd_1899.dcm',
+     ])
+     ),
+
+    ('["b", "c", "d"] == strings AND format <= "DICOM"',
+     frozenset([
+         '/bcd_2018.dcm',
+         '/bcd_1981.dcm',
+         '/bcd_1899.dcm',
+     ])
+     ),
+
+    ('has_format in [false, null]',
+     frozenset([
+         '/def_1899.none',
+         '/abc_1899.none',
+         '/bcd_1899.none',
+         '/xyz_1899.none',
+         '/bcd_2018.none',
+         '/abc_1981.none',
+         '/def_2018.none',
+         '/xyz_2018.none',
+         '/abc_2018.none',
+         '/def_1981.none',
+         '/xyz_1981.none',
+         '/bcd_1981.none',
+     ])
+     ),
+
+    ('format == null',
+     frozenset([
+         '/bcd_1981.none',
+         '/abc_1899.none',
+         '/def_1899.none',
+         '/bcd_2018.none',
+         '/abc_1981.none',
+         '/def_2018.none',
+         '/xyz_2018.none',
+         '/abc_2018.none',
+         '/def_1981.none',
+         '/bcd_1899.none',
+         '/xyz_1899.none',
+         '/xyz_1981.none'
+     ])
+     ),
+
+    ('strings == null',
+     set()),
+
+    ('strings != NULL',
+     frozenset([
+         '/xyz_1899.nii',
+         '/xyz_2018.dcm',
+         '/xyz_1899.mgz',
+         '/bcd_2018.mgz',
+         '/bcd_1899.nii',
+         '/def_2018.none',
+         '/def_1899.mgz',
+         '/def_1899.nii',
+         '/bcd_1981.mgz',
+         '/abc_1981.nii',
+         '/def_2018.mgz',
+         '/abc_1899.nii',
+         '/bcd_2018.nii',
+         '/abc_2018.dcm',
+         '/xyz_1899.none',
+         '/bcd_1899.dcm',
+         '/bcd_1981.none',
+         '/def_1981.dcm',
+         '/abc_2018.nii',
+         '/def_1899.none',
+         '/xyz_1981.none',
+         '/abc_1981.dcm',
+         '/bcd_2018.dcm',
+         '/def_2018.nii',
+         '/abc_1981.mgz',
+         '/def_2018.dcm',
+         '/abc_1899.none',
+         '/xyz_1981.mgz',
+         '/xyz_1899.dcm',
+         '/abc_1899.dcm',
+         '/def_1899.dcm',
+         '/bcd_1981.nii',
+         '/def_1981.none',
+         '/xyz_1981.nii',
+         '/abc_2018.mgz',
+         '/xyz_2018.none',
+         '/xyz_2018.nii',
+         '/abc_1899.mgz',
+         '/bcd_1899.mgz',
+         '/bcd_2018.none',
+         '/abc_1981.none',
+         '/xyz_1981.dcm',
+         '/abc_2018.none',
+         '/def_1981.nii',
+         '/bcd_1981.dcm',
+         '/def_1981.mgz',
+         '/bcd_1899.none',
+         '/xyz_2018.mgz'
+     ])
+     ),
+
+    ('format != NULL',
+     frozenset([
+         '/xyz_1899.nii',
+         '/xyz_1899.mgz',
+         '/bcd_2018.mgz',
+         '/bcd_1899.nii',
+         '/def_1899.mgz',
+         '/def_1899.nii',
+         '/bcd_1981.mgz',
+         '/abc_1981.nii',
+         '/def_2018.mgz',
+         '/abc_1899.nii',
+         '/bcd_2018.nii',
+         '/abc_2018.dcm',
+         '/xyz_1981.mgz',
+         '/def_1981.dcm',
+         '/abc_2018.nii',
+         '/abc_1981.dcm',
+         '/bcd_2018.dcm',
+         '/def_2018.nii',
+         '/bcd_1981.nii',
+         '/abc_1981.mgz',
+         '/def_2018.dcm',
+         '/bcd_1899.dcm',
+         '/xyz_2018.dcm',
+         '/xyz_1899.dcm',
+         '/abc_1899.dcm',
+         '/def_1899.dcm',
+         '/bcd_1899.mgz',
+         '/xyz_1981.nii',
+         '/abc_2018.mgz',
+         '/xyz_2018.nii',
+         '/abc_1899.mgz',
+         '/xyz_1981.dcm',
+         '/def_1981.nii',
+         '/bcd_1981.dcm',
+         '/def_1981.mgz',
+         '/xyz_2018.mgz'
+     ])
+     ),
+
+    ('name like "%.nii"',
+     frozenset([
+         '/xyz_1899.nii',
+         '/xyz_2018.nii',
+         '/abc_2018.nii',
+         '/bcd_1899.nii',
+         '/bcd_2018.nii',
+         '/def_1899.nii',
+         '/abc_1981.nii',
+         '/def_2018.nii',
+         '/def_1981.nii',
+         '/bcd_1981.nii',
+         '/abc_1899.nii',
+         '/xyz_1981.nii'
+     ])
+     ),
+
+    ('name ilike "%A%"',
+     frozenset([
+         '/abc_1899.none',
+         '/abc_1899.nii',
+         '/abc_2018.nii',
+         '/abc_1899.mgz',
+         '/abc_1899.dcm',
+         '/abc_1981.dcm',
+         '/abc_1981.nii',
+         '/abc_1981.mgz',
+         '/abc_2018.mgz',
+         '/abc_2018.dcm',
+         '/abc_2018.none',
+         '/abc_1981.none'
+     ])
+     ),
+
+    ('all',
+     frozenset([
+         '/xyz_1899.nii',
+         '/xyz_2018.dcm',
+         '/xyz_1899.mgz',
+         '/bcd_2018.mgz',
+         '/bcd_1899.nii',
+         '/def_2018.none',
+         '/def_1899.mgz',
+         '/def_1899.nii',
+         '/bcd_1981.mgz',
+         '/abc_1981.nii',
+         '/def_2018.mgz',
+         '/abc_1899.nii',
+         '/bcd_2018.nii',
+         '/abc_2018.dcm',
+         '/xyz_1899.none',
+         '/bcd_1899.dcm',
+         '/bcd_1981.none',
+         '/def_1981.dcm',
+         '/abc_2018.nii',
+         '/def_1899.none',
+         '/xyz_1981.none',
+         '/abc_1981.dcm',
+         '/bcd_2018.dcm',
+         '/def_2018.nii',
+         '/abc_1981.mgz',
+         '/def_2018.dcm',
+         '/abc_1899.none',
+         '/xyz_1981.mgz',
+         '/xyz_1899.dcm',
+         '/abc_1899.dcm',
+         '/def_1899.dcm',
+         '/bcd_1981.nii',
+         '/def_1981.none',
+         '/xyz_1981.nii',
+         '/abc_2018.mgz',
+         '/xyz_2018.none',
+         '/xyz_2018.nii',
+         '/abc_1899.mgz',
+         '/bcd_1899.mgz',
+         '/bcd_2018.none',
+         '/abc_1981.none',
+         '/xyz_1981.dcm',
+         '/abc_2018.none',
+         '/def_1981.nii',
+         '/bcd_1981.dcm',
+         '/def_1981.mgz',
+         '/bcd_1899.none',
+         '/xyz_2018.mgz'
+     ])
+     ),
+)
+
 
 class TestsSQLiteInMemory(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        """
+        Creates one in-memory database for all the tests of the class,
+        it keeps its single connection until tearDownClass()
+        """
+        cls.database = Database('sqlite:///:memory:')
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.database = None
+
+    def setUp(self):
+        self.database.clear()
+
     def test_add_get_document(self):
-        now = datetime.datetime.now()
-        db = Database('sqlite:///:memory:')
-        with db as dbs:
+        with self.database as dbs:
             dbs.add_collection('test')
-            base_doc = {
-                'string': 'string',
-                'int': 1,
-                'float': 1.4,
-                'boolean': True,
-                'datetime': now,
-                'date': now.date(),
-                'time': now.time(),
-                'dict': {
-                    'string': 'string',
-                    'int': 1,
-                    'float': 1.4,
-                    'boolean': True,
-                }
-            }
-            doc = base_doc.copy()
-            for k, v in base_doc.items():
-                lk = 'list_%s' % k
-                doc[lk] = [v]
-            doc['index'] = 'test'
+            doc = DOC_WITH_LISTS
             dbs.add_document('test', doc)
             stored_doc = dbs.get_document('test', 'test')._dict()
             self.maxDiff = None
             self.assertEqual(doc, stored_doc)
 
-def create_test_case(**database_creation_parameters):
+class TestReadOnlyDatabase(unittest.TestCase):
+    """
+    Tests that only read the database. The database is built once for all
+    the tests of the class and must not be modified by them. It is in memory
+    unless on_disk is True.
+    """
+
+    on_disk = False
+
+    @classmethod
+    def setUpClass(cls):
+        cls.temp_folder = None
+        if cls.on_disk:
+            cls.temp_folder = tempfile.mkdtemp(prefix='populse_db')
+            database_url = 'sqlite:///' + os.path.join(cls.temp_folder, 'read_only.db')
+        else:
+            database_url = 'sqlite:///:memory:'
+        cls.database = Database(database_url)
+        with cls.database as session:
+            session.add_collection("collection1", "name")
+            session.add_fields([
+                ["collection1", "PatientName", FIELD_TYPE_STRING, "Name of the patient"],
+                ["collection1", "SequenceName", FIELD_TYPE_STRING, "Name of the sequence"],
+                ["collection1", "Dataset dimensions", FIELD_TYPE_LIST_INTEGER, None],
+                ["collection1", "Bits per voxel", FIELD_TYPE_INTEGER, None],
+                ["collection1", "Grids spacing", FIELD_TYPE_LIST_FLOAT, None]])
+            session.add_document("collection1", {
+                "name": "document1",
+                "PatientName": "test",
+                "Bits per voxel": 10,
+                "Dataset dimensions": [3, 28, 28, 3],
+                "Grids spacing": [0.234375, 0.234375, 0.4]})
+            session.add_collection("collection2", "id")
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.database = None
+        if cls.temp_folder:
+            shutil.rmtree(cls.temp_folder)
+        cls.temp_folder = None
+
+    def test_get_fields(self):
+        """
+        Tests the method giving all fields rows, given a collection
+        """
+
+        with self.database as session:
+            fields = session.get_fields("collection1")
+            self.assertEqual(len(fields), 6)
+            self.assertEqual(set(field.collection_name for field in fields),
+                             set(["collection1"]))
+
+            # Fields of another collection are not returned
+            fields = session.get_fields("collection2")
+            self.assertEqual([field.field_name for field in fields], ["id"])
+
+            # Testing with a collection not existing
+            self.assertEqual(session.get_fields("collection_not_existing"), [])
+
+    def test_get_field_names(self):
+        """
+        Tests the method giving all fields names, given a collection
+        """
+
+        with self.database as session:
+            fields = session.get_fields_names("collection1")
+            self.assertEqual(sorted(fields), sorted(["name", "PatientName", "SequenceName",
+                                                     "Dataset dimensions", "Bits per voxel",
+                                                     "Grids spacing"]))
+            self.assertEqual(session.get_fields_names("collection2"), ["id"])
+
+            # Testing with a collection not existing
+            self.assertEqual(session.get_fields_names("collection_not_existing"), [])
+
+    def test_get_field(self):
+        """
+        Tests the method giving the field row given a field
+        """
+
+        with self.database as session:
+            # Testing that the field is returned if it exists
+            self.assertIsNotNone(session.get_field("collection1", "PatientName"))
+
+            # Testing that None is returned if the field does not exist
+            self.assertIsNone(session.get_field("collection1", "Test"))
+
+            # Testing that None is returned if the collection does not exist
+            self.assertIsNone(session.get_field("collection_not_existing", "PatientName"))
+
+            # Testing that None is returned if both collection and field do not exist
+            self.assertIsNone(session.get_field("collection_not_existing", "Test"))
+
+    def test_get_value(self):
+        """
+        Tests the method giving the current value, given a document and a field
+        """
+
+        with self.database as session:
+            # Testing that the value is returned if it exists
+            self.assertEqual(session.get_value(
+                "collection1", "document1", "PatientName"), "test")
+            self.assertEqual(session.get_value(
+                "collection1", "document1", "Bits per voxel"), 10)
+            self.assertEqual(session.get_value(
+                "collection1", "document1", "Dataset dimensions"), [3, 28, 28, 3])
+            self.assertEqual(session.get_value(
+                "collection1", "document1", "Grids spacing"), [0.234375, 0.234375, 0.4])
+
+            # Testing when the value is not existing
+            self.assertIsNone(session.get_value("collection_not_existing", "document1", "PatientName"))
+            self.assertIsNone(session.get_value("collection1", "document3", "PatientName"))
+            self.assertIsNone(session.get_value("collection1", "document1", "NotExisting"))
+            self.assertIsNone(session.get_value("collection1", "document3", "NotExisting"))
+            self.assertIsNone(session.get_value("collection1", "document2", "Grids spacing"))
+
+            # Testing with wrong parameters
+            self.assertIsNone(session.get_value(3, "document1", "Grids spacing"))
+            self.assertIsNone(session.get_value("collection1", 1, "Grids spacing"))
+            self.assertIsNone(session.get_value("collection1", "document1", None))
+            self.assertIsNone(session.get_value("collection1", 3.5, None))
+
+
+class TestReadOnlyDatabaseOnDisk(TestReadOnlyDatabase):
+    """
+    Same read-only tests with a database file
+    """
+
+    on_disk = True
+
+
+def create_test_case(on_disk=False, **database_creation_parameters):
     class TestDatabaseMethods(unittest.TestCase):
         """
         Class executing the unit tests of populse_db
         """
 
+        @classmethod
+        def setUpClass(cls):
+            """
+            Called once before the unit tests of the class
+            In-memory databases are created once and shared by all the tests,
+            the modifications done by each test are rolled back by tearDown().
+            Database files are all created in the same temporary folder.
+            """
+            cls.shared_database = None
+            cls.temp_folder = None
+
+        @classmethod
+        def tearDownClass(cls):
+            """
+            Called once after the unit tests of the class
+            Releases the shared in-memory database and deletes the temporary
+            folder containing the database files
+            """
+            cls.shared_database = None
+            if cls.temp_folder:
+                shutil.rmtree(cls.temp_folder)
+            cls.temp_folder = None
+
         def setUp(self):
             """
             Called before every unit test
-            Creates a temporary folder containing the database file that will be used for the test
+            Uses an in-memory database unless on_disk is True. In that case
+            the test uses its own database file.
             """
             self.database_creation_parameters = dict(database_creation_parameters)
+            self.database_file = None
+            self.test_transaction = None
             if 'database_url' not in self.database_creation_parameters:
-                self.temp_folder = tempfile.mkdtemp(prefix='populse_db')
-                path = os.path.join(self.temp_folder, "test.db")
-                self.database_creation_parameters['database_url'] = 'sqlite:///' + path
-            else:
-                self.temp_folder = None
+                self.database_creation_parameters['database_url'] = 'sqlite:///:memory:'
             self.database_url = self.database_creation_parameters['database_url']
+            if (self.database_url.startswith('postgresql') and
+                    find_spec('psycopg2') is None):
+                raise unittest.SkipTest('psycopg2 is not installed')
+            if on_disk:
+                self.use_database_file()
 
         def tearDown(self):
             """
             Called after every unit test
-            Deletes the temporary folder created for the test
+            Rolls back the modifications done in the shared in-memory database
+            and deletes the database file created for the test
             """
-            if self.temp_folder:
-                shutil.rmtree(self.temp_folder)
+            if self.test_transaction is not None:
+                # Leaving the outermost session with an exception rolls back
+                self.test_transaction.__exit__(Exception, None, None)
+                self.test_transaction = None
+            if self.database_file:
+                for suffix in ('', '-wal', '-shm', '-journal'):
+                    if os.path.exists(self.database_file + suffix):
+                        os.remove(self.database_file + suffix)
                 del self.database_creation_parameters['database_url']
-            self.temp_folder = None
+            self.database_file = None
+
+        def use_database_file(self):
+            """
+            Replaces an in-memory database by a file named after the test in
+            the temporary folder of the class.
+            Tests that reopen the database call this method first.
+            """
+            if self.database_url == 'sqlite:///:memory:':
+                if self.temp_folder is None:
+                    type(self).temp_folder = tempfile.mkdtemp(prefix='populse_db')
+                self.database_file = os.path.join(self.temp_folder,
+                                                  '%s.db' % self._testMethodName)
+                self.database_url = 'sqlite:///' + self.database_file
+                self.database_creation_parameters['database_url'] = self.database_url
             
         def create_database(self, clear=True):
             """
             Opens the database
-            :param clear: Bool to know if the database must be cleared
+            :param clear: Bool to know if the database must be cleared (a shared
+                          in-memory database is always empty when a test starts)
             """
 
-            try:
+            in_memory = (self.database_url == 'sqlite:///:memory:')
+            db = (self.shared_database if in_memory else None)
+            if db is None:
                 db = Database(**self.database_creation_parameters)
-            except Exception as e:
-                if self.database_creation_parameters['database_url'].startswith('postgresql'):
-                    raise unittest.SkipTest(str(e))
-                raise
-            except ImportError as e:
-                if ('psycopg2' in str(e) and 
-                    self.database_creation_parameters['database_url'].startswith('postgresql')):
-                    raise unittest.SkipTest(str(e))
-                raise
-            if clear:
+                if in_memory:
+                    type(self).shared_database = db
+            if in_memory:
+                # The sessions of the test are nested in a session that is
+                # rolled back by tearDown(), the database is never cleared.
+                if self.test_transaction is None:
+                    db.__enter__()
+                    self.test_transaction = db
+            elif clear:
                 db.clear()
             return db
 
@@ -103,7 +863,8 @@ def create_test_case(**database_creation_parameters):
             Tests the parameters of the Database class constructor
             """
             # Testing with wrong engine
-            self.assertRaises(ValueError, lambda : Database("engine").__enter__())
+            with self.assertRaises(ValueError):
+                Database("engine").__enter__()
 
         def test_add_field(self):
             """
@@ -128,17 +889,19 @@ def create_test_case(**database_creation_parameters):
                 self.assertEqual(field.collection_name, "collection1")
 
                 # Testing with a field that already exists
-                self.assertRaises(ValueError, lambda : session.add_field("collection1", "PatientName", FIELD_TYPE_STRING,
-                                      "Name of the patient"))
+                with self.assertRaises(ValueError):
+                    session.add_field("collection1", "PatientName", FIELD_TYPE_STRING, "Name of the patient")
 
                 # Testing with several field types
-                session.add_field("collection1", "BandWidth", FIELD_TYPE_FLOAT, None)
-                session.add_field("collection1", "AcquisitionTime", FIELD_TYPE_TIME, None)
-                session.add_field("collection1", "AcquisitionDate", FIELD_TYPE_DATETIME, None)
-                session.add_field("collection1", "Dataset dimensions", FIELD_TYPE_LIST_INTEGER,
-                                  None)
-                session.add_field("collection1", "Boolean", FIELD_TYPE_BOOLEAN, None)
-                session.add_field("collection1", "Boolean list", FIELD_TYPE_LIST_BOOLEAN, None)
+                fields = [["collection1", "BandWidth", FIELD_TYPE_FLOAT, None],
+                          ["collection1", "AcquisitionTime", FIELD_TYPE_TIME, None],
+                          ["collection1", "AcquisitionDate", FIELD_TYPE_DATETIME, None],
+                          ["collection1", "Dataset dimensions", FIELD_TYPE_LIST_INTEGER, None],
+                          ["collection1", "Boolean", FIELD_TYPE_BOOLEAN, None],
+                          ["collection1", "Boolean list", FIELD_TYPE_LIST_BOOLEAN, None]]
+                session.add_fields(fields)
+                for collection, name, field_type, description in fields:
+                    self.assertEqual(session.get_field(collection, name).field_type, field_type)
 
                 # Testing with close field names
                 session.add_field("collection1", "Bits per voxel", FIELD_TYPE_INTEGER, "with space")
@@ -154,15 +917,20 @@ def create_test_case(**database_creation_parameters):
                     "collection1", "bitspervoxel").description, "lower case")
 
                 # Testing with wrong parameters
-                self.assertRaises(ValueError, lambda : session.add_field("collection_not_existing", "Field", FIELD_TYPE_LIST_INTEGER,
-                                      None))
-                self.assertRaises(ValueError, lambda : session.add_field(True, "Field", FIELD_TYPE_LIST_INTEGER, None))
-                self.assertRaises(ValueError, lambda : session.add_field("collection1", None, FIELD_TYPE_LIST_INTEGER, None))
-                self.assertRaises(ValueError, lambda : session.add_field("collection1", "Patient Name", None, None))
-                self.assertRaises(ValueError, lambda : session.add_field("collection1", "Patient Name", FIELD_TYPE_STRING, 1.5))
+                with self.assertRaises(ValueError):
+                    session.add_field("collection_not_existing", "Field", FIELD_TYPE_LIST_INTEGER, None)
+                with self.assertRaises(ValueError):
+                    session.add_field(True, "Field", FIELD_TYPE_LIST_INTEGER, None)
+                with self.assertRaises(ValueError):
+                    session.add_field("collection1", None, FIELD_TYPE_LIST_INTEGER, None)
+                with self.assertRaises(ValueError):
+                    session.add_field("collection1", "Patient Name", None, None)
+                with self.assertRaises(ValueError):
+                    session.add_field("collection1", "Patient Name", FIELD_TYPE_STRING, 1.5)
 
                 # Testing that the document primary key field is taken
-                self.assertRaises(ValueError, lambda : session.add_field("collection1", "name", FIELD_TYPE_STRING, None))
+                with self.assertRaises(ValueError):
+                    session.add_field("collection1", "name", FIELD_TYPE_STRING, None)
 
                 # TODO Testing column creation
 
@@ -192,11 +960,22 @@ def create_test_case(**database_creation_parameters):
                 fields = []
                 fields.append(["collection1", "Age", FIELD_TYPE_STRING, ""])
                 fields.append(["collection1", "Gender", FIELD_TYPE_STRING])
-                self.assertRaises(ValueError, lambda : session.add_fields(fields))
+                with self.assertRaises(ValueError):
+                    session.add_fields(fields)
                 fields = []
                 fields.append("Field")
-                self.assertRaises(ValueError, lambda: session.add_fields(fields))
-                self.assertRaises(ValueError, lambda: session.add_fields(True))
+                with self.assertRaises(ValueError):
+                    session.add_fields(fields)
+                with self.assertRaises(ValueError):
+                    session.add_fields(True)
+
+                # Fields are all checked before any of them is created
+                fields = []
+                fields.append(["collection1", "Age", FIELD_TYPE_INTEGER, ""])
+                fields.append(["collection1", "Age", FIELD_TYPE_STRING, ""])
+                with self.assertRaises(ValueError):
+                    session.add_fields(fields)
+                self.assertIsNone(session.get_field("collection1", "Age"))
 
         def test_remove_field(self):
             """
@@ -210,10 +989,10 @@ def create_test_case(**database_creation_parameters):
                 session.add_collection("current", "name")
 
                 # Adding fields
-                session.add_field("current", "PatientName", FIELD_TYPE_STRING,
-                                  "Name of the patient")
-                session.add_field("current", "SequenceName", FIELD_TYPE_STRING, None)
-                session.add_field("current", "Dataset dimensions", FIELD_TYPE_LIST_INTEGER, None)
+                session.add_fields([
+                    ["current", "PatientName", FIELD_TYPE_STRING, "Name of the patient"],
+                    ["current", "SequenceName", FIELD_TYPE_STRING, None],
+                    ["current", "Dataset dimensions", FIELD_TYPE_LIST_INTEGER, None]])
 
                 # Adding documents
                 document = {}
@@ -248,10 +1027,10 @@ def create_test_case(**database_creation_parameters):
                 self.assertIsNone(session.get_field("current", "SequenceName"))
 
                 # Adding fields again
-                session.add_field("current", "PatientName", FIELD_TYPE_STRING,
-                                  "Name of the patient")
-                session.add_field("current", "SequenceName", FIELD_TYPE_STRING, None)
-                session.add_field("current", "Dataset dimensions", FIELD_TYPE_LIST_INTEGER, None)
+                session.add_fields([
+                    ["current", "PatientName", FIELD_TYPE_STRING, "Name of the patient"],
+                    ["current", "SequenceName", FIELD_TYPE_STRING, None],
+                    ["current", "Dataset dimensions", FIELD_TYPE_LIST_INTEGER, None]])
 
                 # Testing with list of fields
                 session.remove_field("current", ["SequenceName", "PatientName"])
@@ -259,15 +1038,22 @@ def create_test_case(**database_creation_parameters):
                 self.assertIsNone(session.get_field("current", "PatientName"))
 
                 # Testing with a field not existing
-                self.assertRaises(ValueError, lambda : session.remove_field("not_existing", "document1"))
-                self.assertRaises(ValueError, lambda : session.remove_field(1, "NotExisting"))
-                self.assertRaises(ValueError, lambda : session.remove_field("current", "NotExisting"))
-                self.assertRaises(ValueError, lambda : session.remove_field("current", "Dataset dimension"))
-                self.assertRaises(ValueError, lambda : session.remove_field("current", ["SequenceName", "PatientName", "Not_Existing"]))
+                with self.assertRaises(ValueError):
+                    session.remove_field("not_existing", "document1")
+                with self.assertRaises(ValueError):
+                    session.remove_field(1, "NotExisting")
+                with self.assertRaises(ValueError):
+                    session.remove_field("current", "NotExisting")
+                with self.assertRaises(ValueError):
+                    session.remove_field("current", "Dataset dimension")
+                with self.assertRaises(ValueError):
+                    session.remove_field("current", ["SequenceName", "PatientName", "Not_Existing"])
 
                 # Testing with wrong parameters
-                self.assertRaises(Exception, lambda : session.remove_field("current", 1))
-                self.assertRaises(Exception, lambda : session.remove_field("current", None))
+                with self.assertRaises(Exception):
+                    session.remove_field("current", 1)
+                with self.assertRaises(Exception):
+                    session.remove_field("current", None)
 
                 # Removing list of fields with list type
                 session.add_field("current", "list1", FIELD_TYPE_LIST_INTEGER, None)
@@ -276,65 +1062,17 @@ def create_test_case(**database_creation_parameters):
                 self.assertIsNone(session.get_field("current", "list1"))
                 self.assertIsNone(session.get_field("current", "list2"))
 
-                # TODO Testing column removal
+                # Removing an indexed field
+                session.add_field("current", "Indexed", FIELD_TYPE_STRING, None, index=True)
+                session.add_field("current", "Kept", FIELD_TYPE_STRING, None, index=True)
+                session.set_values("current", "document1", {"Indexed": "a", "Kept": "b"})
+                session.remove_field("current", "Indexed")
+                self.assertIsNone(session.get_field("current", "Indexed"))
+                self.assertEqual(session.get_value("current", "document1", "Kept"), "b")
+                self.assertEqual(list(session.filter_documents("current", '{Kept} == "b"', fields=["name"], as_list=True)),
+                                 [["document1"]])
 
-        def test_get_field(self):
-            """
-            Tests the method giving the field row given a field
-            """
-
-            database = self.create_database()
-            with database as session:
-                # Adding a collection
-                session.add_collection("collection1", "name")
-
-                # Adding a field
-                session.add_field("collection1", "PatientName", FIELD_TYPE_STRING,
-                                  "Name of the patient")
-
-                # Testing that the field is returned if it exists
-                self.assertIsNotNone(session.get_field("collection1", "PatientName"))
-
-                # Testing that None is returned if the field does not exist
-                self.assertIsNone(session.get_field("collection1", "Test"))
-
-                # Testing that None is returned if the collection does not exist
-                self.assertIsNone(session.get_field("collection_not_existing", "PatientName"))
-
-                # Testing that None is returned if both collection and field do not exist
-                self.assertIsNone(session.get_field("collection_not_existing", "Test"))
-
-        def test_get_fields(self):
-            """
-            Tests the method giving all fields rows, given a collection
-            """
-
-            database = self.create_database()
-            with database as session:
-                # Adding a collection
-                session.add_collection("collection1", "name")
-
-                # Adding a field
-                session.add_field("collection1", "PatientName", FIELD_TYPE_STRING,
-                                  "Name of the patient")
-
-                fields = session.get_fields("collection1")
-                self.assertEqual(len(fields), 2)
-
-                session.add_field("collection1", "SequenceName", FIELD_TYPE_STRING,
-                                  "Name of the patient")
-
-                fields = session.get_fields("collection1")
-                self.assertEqual(len(fields), 3)
-
-                # Adding a second collection
-                session.add_collection("collection2", "id")
-
-                fields = session.get_fields("collection1")
-                self.assertEqual(len(fields), 3)
-
-                # Testing with a collection not existing
-                self.assertEqual(session.get_fields("collection_not_existing"), [])
+                # TODO Testing column removal
 
         def test_set_value(self):
 
@@ -350,33 +1088,29 @@ def create_test_case(**database_creation_parameters):
                 session.add_document("collection1", document)
 
                 # Adding fields
-                session.add_field("collection1", "PatientName", FIELD_TYPE_STRING,
-                                  "Name of the patient")
-                session.add_field(
-                    "collection1", "Bits per voxel", FIELD_TYPE_INTEGER, None)
-                session.add_field(
-                    "collection1", "bits per voxel", FIELD_TYPE_INTEGER, None)
-                session.add_field(
-                    "collection1", "AcquisitionDate", FIELD_TYPE_DATETIME, None)
-                session.add_field(
-                    "collection1", "AcquisitionTime", FIELD_TYPE_TIME, None)
+                session.add_fields([
+                    ["collection1", "PatientName", FIELD_TYPE_STRING, "Name of the patient"],
+                    ["collection1", "Bits per voxel", FIELD_TYPE_INTEGER, None],
+                    ["collection1", "bits per voxel", FIELD_TYPE_INTEGER, None],
+                    ["collection1", "AcquisitionDate", FIELD_TYPE_DATETIME, None],
+                    ["collection1", "AcquisitionTime", FIELD_TYPE_TIME, None]])
 
                 # Adding values and setting them
-                session.add_value("collection1", "document1", "PatientName", "test", "test")
+                session.add_value("collection1", "document1", "PatientName", "test")
                 session.set_value("collection1", "document1", "PatientName", "test2")
 
-                session.add_value("collection1", "document1", "Bits per voxel", 1, 1)
+                session.add_value("collection1", "document1", "Bits per voxel", 1)
                 session.set_value("collection1", "document1", "Bits per voxel", 2)
                 session.set_value("collection1", "document1", "bits per voxel", 42)
 
                 date = datetime.datetime(2014, 2, 11, 8, 5, 7)
-                session.add_value("collection1", "document1", "AcquisitionDate", date, date)
+                session.add_value("collection1", "document1", "AcquisitionDate", date)
                 self.assertEqual(session.get_value("collection1", "document1", "AcquisitionDate"), date)
                 date = datetime.datetime(2015, 2, 11, 8, 5, 7)
                 session.set_value("collection1", "document1", "AcquisitionDate", date)
 
                 time = datetime.datetime(2014, 2, 11, 0, 2, 20).time()
-                session.add_value("collection1", "document1", "AcquisitionTime", time, time)
+                session.add_value("collection1", "document1", "AcquisitionTime", time)
                 self.assertEqual(session.get_value(
                     "collection1", "document1", "AcquisitionTime"), time)
                 time = datetime.datetime(2014, 2, 11, 15, 24, 20).time()
@@ -397,27 +1131,38 @@ def create_test_case(**database_creation_parameters):
                 self.assertIsNone(session.get_value("collection1", "document1", "PatientName"))
 
                 # Testing when the value is not existing
-                self.assertRaises(ValueError, lambda : session.set_value("collection_not_existing", "document3", "PatientName", None))
-                self.assertRaises(ValueError, lambda : session.set_value("collection1", "document3", "PatientName", None))
-                self.assertRaises(ValueError, lambda : session.set_value("collection1", "document1", "NotExisting", None))
-                self.assertRaises(ValueError, lambda : session.set_value("collection1", "document3", "NotExisting", None))
+                with self.assertRaises(ValueError):
+                    session.set_value("collection_not_existing", "document3", "PatientName", None)
+                with self.assertRaises(ValueError):
+                    session.set_value("collection1", "document3", "PatientName", None)
+                with self.assertRaises(ValueError):
+                    session.set_value("collection1", "document1", "NotExisting", None)
+                with self.assertRaises(ValueError):
+                    session.set_value("collection1", "document3", "NotExisting", None)
 
                 # Testing with wrong types
-                self.assertRaises(ValueError, lambda : session.set_value("collection1", "document1", "Bits per voxel", "test"))
+                with self.assertRaises(ValueError):
+                    session.set_value("collection1", "document1", "Bits per voxel", "test")
                 self.assertEqual(session.get_value("collection1",
                                                    "document1", "Bits per voxel"), 2)
-                self.assertRaises(ValueError, lambda : session.set_value("collection1", "document1", "Bits per voxel", 35.8))
+                with self.assertRaises(ValueError):
+                    session.set_value("collection1", "document1", "Bits per voxel", 35.8)
                 self.assertEqual(session.get_value(
                     "collection1", "document1", "Bits per voxel"), 2)
 
                 # Testing with wrong parameters
-                self.assertRaises(ValueError, lambda : session.set_value(False, "document1", "Bits per voxel", 35))
-                self.assertRaises(ValueError, lambda : session.set_value("collection1", 1, "Bits per voxel", "2"))
-                self.assertRaises(ValueError, lambda : session.set_value("collection1", "document1", None, "1"))
-                self.assertRaises(ValueError, lambda : session.set_value("collection1", 1, None, True))
+                with self.assertRaises(ValueError):
+                    session.set_value(False, "document1", "Bits per voxel", 35)
+                with self.assertRaises(ValueError):
+                    session.set_value("collection1", 1, "Bits per voxel", "2")
+                with self.assertRaises(ValueError):
+                    session.set_value("collection1", "document1", None, "1")
+                with self.assertRaises(ValueError):
+                    session.set_value("collection1", 1, None, True)
 
                 # Testing that setting a primary key value is impossible
-                self.assertRaises(ValueError, lambda : session.set_value("collection1", "document1", "name", None))
+                with self.assertRaises(ValueError):
+                    session.set_value("collection1", "document1", "name", None)
 
         def test_set_values(self):
             """
@@ -435,189 +1180,75 @@ def create_test_case(**database_creation_parameters):
                 session.add_field("collection1", "PatientName", FIELD_TYPE_STRING)
                 session.add_field("collection1", "BandWidth", FIELD_TYPE_FLOAT)
 
-                # Adding documents
-                session.add_document("collection1", "document1")
-                session.add_document("collection1", "document2")
-
-                # Adding values
-                session.add_value("collection1", "document1", "SequenceName", "Flash")
-                session.add_value("collection1", "document1", "PatientName", "Guerbet")
-                session.add_value("collection1", "document1", "BandWidth", 50000)
+                # Adding documents with their values
+                session.add_documents("collection1", [
+                    {"index": "document1",
+                     "SequenceName": "Flash",
+                     "PatientName": "Guerbet",
+                     "BandWidth": 50000},
+                    "document2"])
                 self.assertEqual(session.get_value("collection1", "document1", "SequenceName"), "Flash")
                 self.assertEqual(session.get_value("collection1", "document1", "PatientName"), "Guerbet")
                 self.assertEqual(session.get_value("collection1", "document1", "BandWidth"), 50000)
 
                 # Setting all values
-                values = {}
-                values["PatientName"] = "Patient"
-                values["BandWidth"] = 25000
+                values = {"PatientName": "Patient", "BandWidth": 25000}
                 session.set_values("collection1", "document1", values)
                 self.assertEqual(session.get_value("collection1", "document1", "PatientName"), "Patient")
                 self.assertEqual(session.get_value("collection1", "document1", "BandWidth"), 25000)
 
-                # Testing that the primary_key cannot be set
-                values = {}
-                values["index"] = "document3"
-                values["BandWidth"] = 25000
-                self.assertRaises(ValueError, lambda : session.set_values("collection1", "document1", values))
-
-                # Trying with the field not existing
-                values = {}
-                values["PatientName"] = "Patient"
-                values["BandWidth"] = 25000
-                values["Field_not_existing"] = "value"
-                self.assertRaises(ValueError, lambda : session.set_values("collection1", "document1", values))
-
-                # Trying with invalid values
-                values = {}
-                values["PatientName"] = 50
-                values["BandWidth"] = 25000
-                self.assertRaises(ValueError, lambda : session.set_values("collection1", "document1", values))
-                self.assertRaises(Exception, lambda: session.set_values("collection1", "document1", True))
-
-                # Trying with the collection not existing
-                values = {}
-                values["PatientName"] = "Guerbet"
-                values["BandWidth"] = 25000
-                self.assertRaises(ValueError, lambda : session.set_values("collection_not_existing", "document1", values))
-
-                # Trying with the document not existing
-                values = {}
-                values["PatientName"] = "Guerbet"
-                values["BandWidth"] = 25000
-                self.assertRaises(ValueError, lambda : session.set_values("collection1", "document_not_existing", values))
+                for collection, document, values in (
+                        # Testing that the primary_key cannot be set
+                        ("collection1", "document1", {"index": "document3", "BandWidth": 25000}),
+                        # Trying with the field not existing
+                        ("collection1", "document1", {"PatientName": "Patient", "BandWidth": 25000,
+                                                      "Field_not_existing": "value"}),
+                        # Trying with invalid values
+                        ("collection1", "document1", {"PatientName": 50, "BandWidth": 25000}),
+                        # Trying with the collection not existing
+                        ("collection_not_existing", "document1", {"PatientName": "Guerbet", "BandWidth": 25000}),
+                        # Trying with the document not existing
+                        ("collection1", "document_not_existing", {"PatientName": "Guerbet", "BandWidth": 25000})):
+                    with sub_test(self, collection=collection, document=document, values=values):
+                        with self.assertRaises(ValueError):
+                            session.set_values(collection, document, values)
+                with self.assertRaises(Exception):
+                    session.set_values("collection1", "document1", True)
 
                 # Testing with list values
                 session.add_field("collection1", "list1", FIELD_TYPE_LIST_STRING)
                 session.add_field("collection1", "list2", FIELD_TYPE_LIST_INTEGER)
-                session.add_value("collection1", "document1", "list1", ["a", "b", "c"])
-                session.add_value("collection1", "document1", "list2", [1, 2, 3])
-                values = {}
-                values["list1"] = ["a", "a", "a"]
-                values["list2"] = [1, 1, 1]
+                session.set_values("collection1", "document1",
+                                   {"list1": ["a", "b", "c"], "list2": [1, 2, 3]})
+                self.assertEqual(session.get_value("collection1", "document1", "list1"), ["a", "b", "c"])
+                values = {"list1": ["a", "a", "a"], "list2": [1, 1, 1]}
                 session.set_values("collection1", "document1", values)
                 self.assertEqual(session.get_value("collection1", "document1", "list1"), ["a", "a", "a"])
                 self.assertEqual(session.get_value("collection1", "document1", "list2"), [1, 1, 1])
 
-        def test_get_field_names(self):
-            """
-            Tests the method removing a value
-            """
-
-            database = self.create_database()
-            with database as session:
-                # Adding a collection
-                session.add_collection("collection1", "name")
-
-                # Adding a field
-                session.add_field("collection1", "PatientName", FIELD_TYPE_STRING,
-                                  "Name of the patient")
-
-                fields = session.get_fields_names("collection1")
-                self.assertEqual(len(fields), 2)
-                self.assertTrue("name" in fields)
-                self.assertTrue("PatientName" in fields)
-
-                session.add_field("collection1", "SequenceName", FIELD_TYPE_STRING,
-                                  "Name of the patient")
-
-                fields = session.get_fields_names("collection1")
-                self.assertEqual(len(fields), 3)
-                self.assertTrue("name" in fields)
-                self.assertTrue("PatientName" in fields)
-                self.assertTrue("SequenceName" in fields)
-
-                # Adding a second collection
-                session.add_collection("collection2", "id")
-
-                fields = session.get_fields_names("collection1")
-                self.assertEqual(len(fields), 3)
-                self.assertTrue("name" in fields)
-                self.assertTrue("PatientName" in fields)
-                self.assertTrue("SequenceName" in fields)
-
-                # Testing with a collection not existing
-                self.assertEqual(session.get_fields_names("collection_not_existing"), [])
-
-        def test_get_value(self):
-            """
-            Tests the method giving the current value, given a document and a field
-            """
-
-            database = self.create_database()
-            with database as session:
-                # Adding a collection
-                session.add_collection("collection1", "name")
-
-                # Adding documents
-                document = {}
-                document["name"] = "document1"
-                session.add_document("collection1", document)
-
-                # Adding fields
-                session.add_field("collection1", "PatientName", FIELD_TYPE_STRING,
-                                  "Name of the patient")
-                session.add_field("collection1", "Dataset dimensions", FIELD_TYPE_LIST_INTEGER,
-                                  None)
-                session.add_field("collection1", "Bits per voxel", FIELD_TYPE_INTEGER, None)
-                session.add_field("collection1", "Grids spacing", FIELD_TYPE_LIST_FLOAT, None)
-
-                # Adding values
-                session.add_value("collection1", "document1", "PatientName", "test")
-                session.add_value("collection1", "document1", "Bits per voxel", 10)
-                session.add_value(
-                    "collection1", "document1", "Dataset dimensions", [3, 28, 28, 3])
-                session.add_value("collection1", "document1", "Grids spacing", [
-                    0.234375, 0.234375, 0.4])
-
-                # Testing that the value is returned if it exists
-                self.assertEqual(session.get_value(
-                    "collection1", "document1", "PatientName"), "test")
-                self.assertEqual(session.get_value(
-                    "collection1", "document1", "Bits per voxel"), 10)
-                self.assertEqual(session.get_value(
-                    "collection1", "document1", "Dataset dimensions"), [3, 28, 28, 3])
-                self.assertEqual(session.get_value(
-                    "collection1", "document1", "Grids spacing"), [0.234375, 0.234375, 0.4])
-
-                # Testing when the value is not existing
-                self.assertIsNone(session.get_value("collection_not_existing", "document1", "PatientName"))
-                self.assertIsNone(session.get_value("collection1", "document3", "PatientName"))
-                self.assertIsNone(session.get_value("collection1", "document1", "NotExisting"))
-                self.assertIsNone(session.get_value("collection1", "document3", "NotExisting"))
-                self.assertIsNone(session.get_value("collection1", "document2", "Grids spacing"))
-
-                # Testing with wrong parameters
-                self.assertIsNone(session.get_value(3, "document1", "Grids spacing"))
-                self.assertIsNone(session.get_value("collection1", 1, "Grids spacing"))
-                self.assertIsNone(session.get_value("collection1", "document1", None))
-                self.assertIsNone(session.get_value("collection1", 3.5, None))
-
         def test_check_type_value(self):
             """
             Tests the method checking the validity of incoming values
             """
 
-            database = self.create_database()
-            with database as session:
-                self.assertTrue(DatabaseSession.check_value_type("string", FIELD_TYPE_STRING))
-                self.assertFalse(DatabaseSession.check_value_type(1, FIELD_TYPE_STRING))
-                self.assertTrue(DatabaseSession.check_value_type(None, FIELD_TYPE_STRING))
-                self.assertTrue(DatabaseSession.check_value_type(1, FIELD_TYPE_INTEGER))
-                self.assertTrue(DatabaseSession.check_value_type(1, FIELD_TYPE_FLOAT))
-                self.assertTrue(DatabaseSession.check_value_type(1.5, FIELD_TYPE_FLOAT))
-                self.assertFalse(DatabaseSession.check_value_type(None, None))
-                self.assertTrue(DatabaseSession.check_value_type([1.5], FIELD_TYPE_LIST_FLOAT))
-                self.assertFalse(DatabaseSession.check_value_type(1.5, FIELD_TYPE_LIST_FLOAT))
-                self.assertFalse(DatabaseSession.check_value_type([1.5, "test"], FIELD_TYPE_LIST_FLOAT))
-                value = {}
-                value["test1"] = 1
-                value["test2"] = 2
-                self.assertTrue(DatabaseSession.check_value_type(value, FIELD_TYPE_JSON))
-                value2 = {}
-                value2["test3"] = 1
-                value2["test4"] = 2
-                self.assertTrue(DatabaseSession.check_value_type([value, value2], FIELD_TYPE_LIST_JSON))
+            # check_value_type is a static method, no database is needed
+            json_value = {"test1": 1, "test2": 2}
+            json_value2 = {"test3": 1, "test4": 2}
+            for value, field_type, expected in (
+                    ("string", FIELD_TYPE_STRING, True),
+                    (1, FIELD_TYPE_STRING, False),
+                    (None, FIELD_TYPE_STRING, True),
+                    (1, FIELD_TYPE_INTEGER, True),
+                    (1, FIELD_TYPE_FLOAT, True),
+                    (1.5, FIELD_TYPE_FLOAT, True),
+                    (None, None, False),
+                    ([1.5], FIELD_TYPE_LIST_FLOAT, True),
+                    (1.5, FIELD_TYPE_LIST_FLOAT, False),
+                    ([1.5, "test"], FIELD_TYPE_LIST_FLOAT, False),
+                    (json_value, FIELD_TYPE_JSON, True),
+                    ([json_value, json_value2], FIELD_TYPE_LIST_JSON, True)):
+                self.assertEqual(DatabaseSession.check_value_type(value, field_type),
+                                 expected, (value, field_type))
 
         def test_add_value(self):
             """
@@ -639,18 +1270,16 @@ def create_test_case(**database_creation_parameters):
                 session.add_document("collection1", document)
 
                 # Adding fields
-                session.add_field("collection1", "PatientName", FIELD_TYPE_STRING,
-                                  "Name of the patient")
-                session.add_field(
-                    "collection1", "Bits per voxel", FIELD_TYPE_INTEGER, None)
-                session.add_field("collection1", "BandWidth", FIELD_TYPE_FLOAT, None)
-                session.add_field("collection1", "AcquisitionTime", FIELD_TYPE_TIME, None)
-                session.add_field("collection1", "AcquisitionDate", FIELD_TYPE_DATETIME, None)
-                session.add_field("collection1", "Dataset dimensions", FIELD_TYPE_LIST_INTEGER,
-                                  None)
-                session.add_field("collection1", "Grids spacing", FIELD_TYPE_LIST_FLOAT, None)
-                session.add_field("collection1", "Boolean", FIELD_TYPE_BOOLEAN, None)
-                session.add_field("collection1", "Boolean list", FIELD_TYPE_LIST_BOOLEAN, None)
+                session.add_fields([
+                    ["collection1", "PatientName", FIELD_TYPE_STRING, "Name of the patient"],
+                    ["collection1", "Bits per voxel", FIELD_TYPE_INTEGER, None],
+                    ["collection1", "BandWidth", FIELD_TYPE_FLOAT, None],
+                    ["collection1", "AcquisitionTime", FIELD_TYPE_TIME, None],
+                    ["collection1", "AcquisitionDate", FIELD_TYPE_DATETIME, None],
+                    ["collection1", "Dataset dimensions", FIELD_TYPE_LIST_INTEGER, None],
+                    ["collection1", "Grids spacing", FIELD_TYPE_LIST_FLOAT, None],
+                    ["collection1", "Boolean", FIELD_TYPE_BOOLEAN, None],
+                    ["collection1", "Boolean list", FIELD_TYPE_LIST_BOOLEAN, None]])
 
                 # Adding values
                 session.add_value("collection1", "document1", "PatientName", "test")
@@ -663,10 +1292,14 @@ def create_test_case(**database_creation_parameters):
                 session.add_value("collection1", "document1", "Boolean", True)
 
                 # Testing when the cell is not existing
-                self.assertRaises(ValueError, lambda : session.add_value("collection_not_existing", "document1", "PatientName", "test"))
-                self.assertRaises(ValueError, lambda : session.add_value("collection1", "document1", "NotExisting", "none"))
-                self.assertRaises(ValueError, lambda : session.add_value("collection1", "document3", "SequenceName", "none"))
-                self.assertRaises(ValueError, lambda : session.add_value("collection1", "document3", "NotExisting", "none"))
+                with self.assertRaises(ValueError):
+                    session.add_value("collection_not_existing", "document1", "PatientName", "test")
+                with self.assertRaises(ValueError):
+                    session.add_value("collection1", "document1", "NotExisting", "none")
+                with self.assertRaises(ValueError):
+                    session.add_value("collection1", "document3", "SequenceName", "none")
+                with self.assertRaises(ValueError):
+                    session.add_value("collection1", "document3", "NotExisting", "none")
 
                 self.assertIsNone(session.add_value("collection1", "document1", "BandWidth", 45))
 
@@ -694,35 +1327,44 @@ def create_test_case(**database_creation_parameters):
                 self.assertEqual(session.get_value("collection1", "document1", "Boolean"), True)
 
                 # Test value override
-                self.assertRaises(ValueError, lambda : session.add_value("collection1", "document1", "PatientName", "test2", "test2"))
+                with self.assertRaises(ValueError):
+                    session.add_value("collection1", "document1", "PatientName", "test2")
 
                 value = session.get_value("collection1", "document1", "PatientName")
                 self.assertEqual(value, "test")
 
                 # Testing with wrong types
-                self.assertRaises(ValueError, lambda : session.add_value("collection1", "document2", "Bits per voxel",
-                                      "space_field", "space_field"))
+                with self.assertRaises(ValueError):
+                    session.add_value("collection1", "document2", "Bits per voxel", "space_field")
 
                 self.assertIsNone(session.get_value(
                     "collection1", "document2", "Bits per voxel"))
-                self.assertRaises(ValueError, lambda : session.add_value("collection1", "document2", "Bits per voxel", 35.5))
+                with self.assertRaises(ValueError):
+                    session.add_value("collection1", "document2", "Bits per voxel", 35.5)
 
                 self.assertIsNone(session.get_value(
                     "collection1", "document2", "Bits per voxel"))
-                self.assertRaises(ValueError, lambda : session.add_value("collection1", "document1", "BandWidth", "test", "test"))
+                with self.assertRaises(ValueError):
+                    session.add_value("collection1", "document1", "BandWidth", "test")
 
                 self.assertEqual(session.get_value("collection1", "document1", "BandWidth"), 45)
 
                 # Testing with wrong parameters
-                self.assertRaises(ValueError, lambda : session.add_value(5, "document1", "Grids spacing", "2", "2"))
-                self.assertRaises(ValueError, lambda : session.add_value("collection1", 1, "Grids spacing", "2", "2"))
-                self.assertRaises(ValueError, lambda : session.add_value("collection1", "document1", None, "1", "1"))
-                self.assertRaises(ValueError, lambda : session.add_value("collection1", "document1", "PatientName", None, None))
+                with self.assertRaises(ValueError):
+                    session.add_value(5, "document1", "Grids spacing", "2")
+                with self.assertRaises(ValueError):
+                    session.add_value("collection1", 1, "Grids spacing", "2")
+                with self.assertRaises(ValueError):
+                    session.add_value("collection1", "document1", None, "1")
+                with self.assertRaises(ValueError):
+                    session.add_value("collection1", "document1", "PatientName", None)
 
                 self.assertEqual(session.get_value(
                     "collection1", "document1", "PatientName"), "test")
-                self.assertRaises(ValueError, lambda : session.add_value("collection1", 1, None, True))
-                self.assertRaises(ValueError, lambda : session.add_value("collection1", "document2", "Boolean", "boolean"))
+                with self.assertRaises(ValueError):
+                    session.add_value("collection1", 1, None, True)
+                with self.assertRaises(ValueError):
+                    session.add_value("collection1", "document2", "Boolean", "boolean")
 
         def test_get_document(self):
             """
@@ -741,6 +1383,12 @@ def create_test_case(**database_creation_parameters):
 
                 # Testing that a document is returned if it exists
                 self.assertIsNotNone(session.get_document("collection1", "document1"))
+
+                # Testing with selected fields
+                document = session.get_document("collection1", "document1", fields=["name"])
+                self.assertEqual(document.name, "document1")
+                self.assertEqual(document["name"], "document1")
+                self.assertEqual(document._dict(), {"name": "document1"})
                 
                 # Testing that None is returned if the document does not exist
                 self.assertIsNone(session.get_document("collection1", "document3"))
@@ -790,10 +1438,12 @@ def create_test_case(**database_creation_parameters):
                 self.assertIsNone(session.get_value("collection1", "document1", "PatientName"))
 
                 # Testing with a collection not existing
-                self.assertRaises(ValueError, lambda : session.remove_document("collection_not_existing", "document1"))
+                with self.assertRaises(ValueError):
+                    session.remove_document("collection_not_existing", "document1")
 
                 # Testing with a document not existing
-                self.assertRaises(ValueError, lambda : session.remove_document("collection1", "NotExisting"))
+                with self.assertRaises(ValueError):
+                    session.remove_document("collection1", "NotExisting")
 
                 # Removing a document
                 session.remove_document("collection1", "document2")
@@ -802,7 +1452,8 @@ def create_test_case(**database_creation_parameters):
                 self.assertIsNone(session.get_document("collection1", "document2"))
 
                 # Trying to remove the document a second time
-                self.assertRaises(ValueError, lambda : session.remove_document("collection1", "document1"))
+                with self.assertRaises(ValueError):
+                    session.remove_document("collection1", "document1")
 
         def test_add_document(self):
             """
@@ -837,9 +1488,12 @@ def create_test_case(**database_creation_parameters):
                     session.add_document("collection1", document)
 
                 # Testing with invalid parameters
-                self.assertRaises(ValueError, lambda : session.add_document(15, "document1"))
-                self.assertRaises(ValueError, lambda : session.add_document("collection_not_existing", "document1"))
-                self.assertRaises(ValueError, lambda : session.add_document("collection1", True))
+                with self.assertRaises(ValueError):
+                    session.add_document(15, "document1")
+                with self.assertRaises(ValueError):
+                    session.add_document("collection_not_existing", "document1")
+                with self.assertRaises(ValueError):
+                    session.add_document("collection1", True)
 
                 # Testing the add of several documents
                 document = {}
@@ -866,6 +1520,53 @@ def create_test_case(**database_creation_parameters):
                     document["field_not_existing"] = None
                     session.add_document("collection1", document)
 
+        def test_add_documents(self):
+            """
+            Tests the method adding several documents
+            """
+
+            database = self.create_database()
+            with database as session:
+
+                # Adding a collection
+                session.add_collection("collection1", "name")
+
+                # Adding fields
+                session.add_field("collection1", "List", FIELD_TYPE_LIST_INTEGER)
+                session.add_field("collection1", "Int", FIELD_TYPE_INTEGER)
+
+                # Adding documents with different fields
+                session.add_documents("collection1", [
+                    {"name": "document1", "List": [1, 2, 3], "Int": 1},
+                    {"name": "document2", "List": [4, 5], "Int": 2},
+                    {"name": "document3", "Int": 3},
+                    "document4"])
+
+                # Testing that the documents have been added
+                self.assertEqual(session.get_documents_names("collection1"),
+                                 ["document1", "document2", "document3", "document4"])
+                self.assertEqual(session.get_value("collection1", "document1", "List"), [1, 2, 3])
+                self.assertEqual(session.get_value("collection1", "document2", "List"), [4, 5])
+                self.assertEqual(session.get_value("collection1", "document3", "Int"), 3)
+                self.assertIsNone(session.get_value("collection1", "document4", "Int"))
+
+                # Adding documents from a generator, in several batches
+                session.add_documents("collection1",
+                                      ({"name": "document%d" % i, "Int": i} for i in range(5, 10)),
+                                      batch_size=2)
+                self.assertEqual(session.get_value("collection1", "document9", "Int"), 9)
+                self.assertEqual(len(session.get_documents_names("collection1")), 9)
+
+                # Testing with invalid parameters
+                with self.assertRaises(ValueError):
+                    session.add_documents("collection_not_existing", ["document10"])
+                with self.assertRaises(ValueError):
+                    session.add_documents("collection1", ["document10", True])
+                with self.assertRaises(ValueError):
+                    session.add_documents("collection1", ["document10", {"Int": 10}])
+                with self.assertRaises(ValueError):
+                    session.add_documents("collection1", ["document10", "document1"])
+
         def test_add_collection(self):
             """
             Tests the method adding a collection
@@ -891,16 +1592,21 @@ def create_test_case(**database_creation_parameters):
                 self.assertEqual(collection.primary_key, "id")
 
                 # Trying with a collection already existing
-                self.assertRaises(ValueError, lambda : session.add_collection("collection1"))
+                with self.assertRaises(ValueError):
+                    session.add_collection("collection1")
 
                 # Trying with table names already taken
-                self.assertRaises(ValueError, lambda : session.add_collection("_field"))
+                with self.assertRaises(ValueError):
+                    session.add_collection("_field")
 
-                self.assertRaises(ValueError, lambda : session.add_collection("_collection"))
+                with self.assertRaises(ValueError):
+                    session.add_collection("_collection")
 
                 # Trying with wrong types
-                self.assertRaises(ValueError, lambda: session.add_collection(True))
-                self.assertRaises(ValueError, lambda: session.add_collection("collection_valid", True))
+                with self.assertRaises(ValueError):
+                    session.add_collection(True)
+                with self.assertRaises(ValueError):
+                    session.add_collection("collection_valid", True)
 
         def test_remove_collection(self):
             """
@@ -964,8 +1670,10 @@ def create_test_case(**database_creation_parameters):
                 self.assertIsNone(session.get_document("collection1", "document"))
 
                 # Testing with a collection not existing
-                self.assertRaises(ValueError, lambda : session.remove_collection("collection_not_existing"))
-                self.assertRaises(ValueError, lambda : session.remove_collection(True))
+                with self.assertRaises(ValueError):
+                    session.remove_collection("collection_not_existing")
+                with self.assertRaises(ValueError):
+                    session.remove_collection(True)
 
         def test_get_collection(self):
             """
@@ -1133,7 +1841,8 @@ def create_test_case(**database_creation_parameters):
                 # Adding values
                 session.add_value("collection1", "document1", "PatientName", "test")
 
-                self.assertRaises(ValueError, lambda : session.add_value("collection1", "document1", "Bits per voxel", "space_field"))
+                with self.assertRaises(ValueError):
+                    session.add_value("collection1", "document1", "Bits per voxel", "space_field")
                 session.add_value("collection1", "document1", "Dataset dimensions", [3, 28, 28, 3])
                 value = session.get_value("collection1", "document1", "Dataset dimensions")
                 self.assertEqual(value, [3, 28, 28, 3])
@@ -1144,10 +1853,14 @@ def create_test_case(**database_creation_parameters):
                 session.remove_value("collection1", "document1", "Dataset dimensions")
 
                 # Testing when not existing
-                self.assertRaises(ValueError, lambda : session.remove_value("collection_not_existing", "document1", "PatientName"))
-                self.assertRaises(ValueError, lambda : session.remove_value("collection1", "document3", "PatientName"))
-                self.assertRaises(ValueError, lambda : session.remove_value("collection1", "document1", "NotExisting"))
-                self.assertRaises(ValueError, lambda : session.remove_value("collection1", "document3", "NotExisting"))
+                with self.assertRaises(ValueError):
+                    session.remove_value("collection_not_existing", "document1", "PatientName")
+                with self.assertRaises(ValueError):
+                    session.remove_value("collection1", "document3", "PatientName")
+                with self.assertRaises(ValueError):
+                    session.remove_value("collection1", "document1", "NotExisting")
+                with self.assertRaises(ValueError):
+                    session.remove_value("collection1", "document3", "NotExisting")
 
                 # Testing that the values are actually removed
                 self.assertIsNone(session.get_value("collection1", "document1", "PatientName"))
@@ -1205,9 +1918,8 @@ def create_test_case(**database_creation_parameters):
                 session.add_field("collection1", "json", FIELD_TYPE_JSON)
                 
                 session.add_document("collection1", doc)
-                self.assertEqual(doc, session.get_document("collection1", "the_name")._dict())
-                self.assertIsNone(session.get_document("collection1", "not_a_valid_name"))
 
+            # The document is read back after the session that stored it
             with database as session:
                 self.assertEqual(doc, session.get_document("collection1", "the_name")._dict())
                 self.assertIsNone(session.get_document("collection1", "not_a_valid_name"))
@@ -1225,12 +1937,48 @@ def create_test_case(**database_creation_parameters):
                 session.add_document("collection_test", "document_test")
 
                 # Checking with invalid collection
-                self.assertRaises(ValueError, lambda : set(document.index for document in session.filter_documents("collection_not_existing", None)))
+                with self.assertRaises(ValueError):
+                    set(document.index for document in session.filter_documents("collection_not_existing", None))
 
                 # Checking that every document is returned if there is no filter
                 documents = set(document.index for document in session.filter_documents("collection_test", None))
                 self.assertEqual(documents, set(['document_test']))
 
+                # Checking that a parsed filter can be reused
+                filter_query = session.filter_query("collection_test", '{field_test} == NULL')
+                for i in range(2):
+                    documents = set(document.index for document in session.filter_documents("collection_test", filter_query))
+                    self.assertEqual(documents, set(['document_test']))
+                with self.assertRaises(ValueError):
+                    session.filter_query("collection_not_existing", None)
+
+                # Checking that only the names can be selected
+                self.assertEqual(session.filter_documents_names("collection_test", None),
+                                 ['document_test'])
+                self.assertEqual(session.filter_documents_names("collection_test", filter_query),
+                                 ['document_test'])
+                self.assertEqual(session.filter_documents_names("collection_test",
+                                                                '{field_test} == "value"'), [])
+                with self.assertRaises(ValueError):
+                    session.filter_documents_names("collection_not_existing", None)
+
+                # Checking that a filter string is resolved against each collection
+                session.add_collection("collection_test2")
+                session.add_document("collection_test2", "document_test2")
+                session.add_field("collection_test2", "field_test", FIELD_TYPE_INTEGER, None)
+                documents = set(document.index for document in session.filter_documents("collection_test2", '{field_test} == NULL'))
+                self.assertEqual(documents, set(['document_test2']))
+                # A parsed filter cannot be used with another collection
+                with self.assertRaises(ValueError):
+                    list(session.filter_documents("collection_test2", filter_query))
+                with self.assertRaises(ValueError):
+                    session.filter_documents_names("collection_test2", filter_query)
+
+                # Checking that a filter cannot be used once its field is removed
+                session.remove_field("collection_test2", "field_test")
+                with self.assertRaises(ValueError):
+                    session.filter_query("collection_test2", '{field_test} == NULL')
+
         def test_filters(self):
             list_datetime = [datetime.datetime(2018, 5, 23, 12, 41, 33, 540),
                              datetime.datetime(1981, 5, 8, 20, 0),
@@ -1243,576 +1991,64 @@ def create_test_case(**database_creation_parameters):
                 session.add_field("collection1", 'format', field_type=FIELD_TYPE_STRING,
                                   description=None, index=True)
                 session.add_field("collection1", 'strings', field_type=FIELD_TYPE_LIST_STRING,
-                                  description=None)
+                                  description=None, index=True)
                 session.add_field("collection1", 'datetime', field_type=FIELD_TYPE_DATETIME,
                                   description=None)
                 session.add_field("collection1", 'has_format', field_type=FIELD_TYPE_BOOLEAN,
                                   description=None)
 
                 files = ('abc', 'bcd', 'def', 'xyz')
-                for file in files:
-                    for date in list_datetime:
-                        for format, ext in (('NIFTI', 'nii'),
-                                            ('DICOM', 'dcm'),
-                                            ('Freesurfer', 'mgz')):
-                            document = dict(
-                                name='/%s_%d.%s' % (file, date.year, ext),
-                                format=format,
-                                strings=list(file),
-                                datetime=date,
-                                has_format=True,
-                            )
-                            session.add_document("collection1", document)
-                        document = '/%s_%d.none' % (file, date.year)
-                        d = dict(name=document, strings=list(file))
-                        session.add_document("collection1", d)
-
-                for filter, expected in (
-                        ('format == "NIFTI"',
-                         set([
-                             '/xyz_1899.nii',
-                             '/xyz_2018.nii',
-                             '/abc_2018.nii',
-                             '/bcd_1899.nii',
-                             '/bcd_2018.nii',
-                             '/def_1899.nii',
-                             '/abc_1981.nii',
-                             '/def_2018.nii',
-                             '/def_1981.nii',
-                             '/bcd_1981.nii',
-                             '/abc_1899.nii',
-                             '/xyz_1981.nii'
-                         ])
-                         ),
-
-                        ('"b" IN strings',
-                         set([
-                             '/bcd_2018.mgz',
-                             '/abc_1899.mgz',
-                             '/abc_1899.dcm',
-                             '/bcd_1981.dcm',
-                             '/abc_1981.dcm',
-                             '/bcd_1981.mgz',
-                             '/bcd_1899.mgz',
-                             '/abc_1981.mgz',
-                             '/abc_2018.mgz',
-                             '/abc_2018.dcm',
-                             '/bcd_2018.dcm',
-                             '/bcd_1899.dcm',
-                             '/abc_2018.nii',
-                             '/bcd_1899.nii',
-                             '/abc_1981.nii',
-                             '/bcd_1981.nii',
-                             '/abc_1899.nii',
-                             '/bcd_2018.nii',
-                             '/abc_1899.none',
-                             '/bcd_1899.none',
-                             '/bcd_1981.none',
-                             '/abc_2018.none',
-                             '/bcd_2018.none',
-                             '/abc_1981.none'
-                         ])
-                         ),
-
-                        ('(format == "NIFTI" OR NOT format == "DICOM")',
-                         set([
-                             '/xyz_1899.nii',
-                             '/xyz_1899.mgz',
-                             '/bcd_2018.mgz',
-                             '/bcd_1899.nii',
-                             '/bcd_2018.nii',
-                             '/def_1899.nii',
-                             '/bcd_1981.mgz',
-                             '/abc_1981.nii',
-                             '/def_2018.mgz',
-                             '/abc_1899.nii',
-                             '/def_1899.mgz',
-                             '/xyz_1899.none',
-                             '/abc_2018.nii',
-                             '/def_1899.none',
-                             '/bcd_1899.mgz',
-                             '/def_2018.nii',
-                             '/abc_1981.mgz',
-                             '/abc_1899.none',
-                             '/xyz_1981.mgz',
-                             '/bcd_1981.nii',
-                             '/xyz_1981.nii',
-                             '/abc_2018.mgz',
-                             '/xyz_2018.nii',
-                             '/abc_1899.mgz',
-                             '/def_1981.nii',
-                             '/def_1981.mgz',
-                             '/bcd_1899.none',
-                             '/xyz_2018.mgz',
-                             '/bcd_1981.none',
-                             '/xyz_1981.none',
-                             '/abc_1981.none',
-                             '/def_2018.none',
-                             '/xyz_2018.none',
-                             '/abc_2018.none',
-                             '/def_1981.none',
-                             '/bcd_2018.none'
-                         ])
-                         ),
-
-                        ('"a" IN strings',
-                         set([
-                             '/abc_1899.none',
-                             '/abc_1899.nii',
-                             '/abc_2018.nii',
-                             '/abc_1899.mgz',
-                             '/abc_1899.dcm',
-                             '/abc_1981.dcm',
-                             '/abc_1981.nii',
-                             '/abc_1981.mgz',
-                             '/abc_2018.mgz',
-                             '/abc_2018.dcm',
-                             '/abc_2018.none',
-                             '/abc_1981.none'
-                         ])
-                         ),
-
-                        ('NOT "b" IN strings',
-                         set([
-                             '/xyz_1899.nii',
-                             '/xyz_2018.dcm',
-                             '/def_1981.dcm',
-                             '/xyz_2018.nii',
-                             '/xyz_1981.dcm',
-                             '/def_1899.none',
-                             '/xyz_1899.dcm',
-                             '/xyz_1981.nii',
-                             '/def_1899.dcm',
-                             '/def_1899.nii',
-                             '/def_2018.mgz',
-                             '/def_2018.nii',
-                             '/xyz_1899.mgz',
-                             '/def_2018.dcm',
-                             '/def_1899.mgz',
-                             '/def_1981.mgz',
-                             '/xyz_1981.mgz',
-                             '/xyz_2018.mgz',
-                             '/xyz_1899.none',
-                             '/def_1981.nii',
-                             '/xyz_2018.none',
-                             '/xyz_1981.none',
-                             '/def_2018.none',
-                             '/def_1981.none'
-                         ])
-                         ),
-                        ('("a" IN strings OR NOT "b" IN strings)',
-                         set([
-                             '/xyz_1899.nii',
-                             '/xyz_1899.mgz',
-                             '/def_1899.nii',
-                             '/abc_1981.nii',
-                             '/def_2018.mgz',
-                             '/abc_1899.nii',
-                             '/def_1899.mgz',
-                             '/abc_2018.dcm',
-                             '/xyz_1899.none',
-                             '/xyz_2018.dcm',
-                             '/def_1981.dcm',
-                             '/abc_2018.nii',
-                             '/def_1899.none',
-                             '/abc_1981.dcm',
-                             '/def_2018.nii',
-                             '/abc_1981.mgz',
-                             '/def_2018.dcm',
-                             '/abc_1899.none',
-                             '/xyz_1981.mgz',
-                             '/xyz_1899.dcm',
-                             '/abc_1899.dcm',
-                             '/def_1899.dcm',
-                             '/xyz_1981.nii',
-                             '/abc_2018.mgz',
-                             '/xyz_2018.nii',
-                             '/abc_1899.mgz',
-                             '/xyz_1981.dcm',
-                             '/def_1981.nii',
-                             '/def_1981.mgz',
-                             '/xyz_2018.mgz',
-                             '/xyz_1981.none',
-                             '/abc_1981.none',
-                             '/def_2018.none',
-                             '/xyz_2018.none',
-                             '/abc_2018.none',
-                             '/def_1981.none'
-                         ])
-                         ),
-
-                        ('format IN ["DICOM", "NIFTI"]',
-                         set([
-                             '/xyz_1899.nii',
-                             '/xyz_2018.dcm',
-                             '/bcd_1899.nii',
-                             '/def_1899.nii',
-                             '/abc_1981.nii',
-                             '/abc_1899.nii',
-                             '/bcd_2018.nii',
-                             '/abc_2018.dcm',
-                             '/bcd_1899.dcm',
-                             '/def_1981.dcm',
-                             '/abc_2018.nii',
-                             '/abc_1981.dcm',
-                             '/bcd_2018.dcm',
-                             '/def_2018.nii',
-                             '/def_2018.dcm',
-                             '/xyz_1899.dcm',
-                             '/abc_1899.dcm',
-                             '/def_1899.dcm',
-                             '/bcd_1981.nii',
-                             '/xyz_1981.nii',
-                             '/xyz_2018.nii',
-                             '/xyz_1981.dcm',
-                             '/def_1981.nii',
-                             '/bcd_1981.dcm',
-                         ])
-                         ),
-
-                        ('(format == "NIFTI" OR NOT format == "DICOM") AND ("a" IN strings OR NOT "b" IN strings)',
-                         set([
-                             '/abc_1899.none',
-                             '/xyz_1899.mgz',
-                             '/abc_1981.mgz',
-                             '/abc_2018.nii',
-                             '/xyz_1899.nii',
-                             '/abc_1899.mgz',
-                             '/def_1899.mgz',
-                             '/def_1899.nii',
-                             '/def_1899.none',
-                             '/abc_1981.nii',
-                             '/def_2018.nii',
-                             '/xyz_2018.nii',
-                             '/def_1981.nii',
-                             '/abc_1899.nii',
-                             '/xyz_1981.nii',
-                             '/abc_2018.mgz',
-                             '/def_1981.mgz',
-                             '/xyz_2018.mgz',
-                             '/xyz_1899.none',
-                             '/def_2018.mgz',
-                             '/xyz_1981.mgz',
-                             '/xyz_1981.none',
-                             '/abc_1981.none',
-                             '/def_2018.none',
-                             '/xyz_2018.none',
-                             '/abc_2018.none',
-                             '/def_1981.none'
-                         ])
-                         ),
-
-                        ('format > "DICOM"',
-                         set([
-                             '/xyz_1899.nii',
-                             '/xyz_1899.mgz',
-                             '/bcd_2018.mgz',
-                             '/bcd_1899.nii',
-                             '/bcd_2018.nii',
-                             '/def_1899.nii',
-                             '/bcd_1981.mgz',
-                             '/abc_1981.nii',
-                             '/def_2018.mgz',
-                             '/abc_1899.nii',
-                             '/def_1899.mgz',
-                             '/abc_2018.nii',
-                             '/def_2018.nii',
-                             '/abc_1981.mgz',
-                             '/xyz_1981.mgz',
-                             '/bcd_1981.nii',
-                             '/xyz_1981.nii',
-                             '/abc_2018.mgz',
-                             '/xyz_2018.nii',
-                             '/abc_1899.mgz',
-                             '/def_1981.nii',
-                             '/def_1981.mgz',
-                             '/bcd_1899.mgz',
-                             '/xyz_2018.mgz'
-                         ])
-                         ),
-
-                        ('format <= "DICOM"',
-                         set([
-                             '/abc_1981.dcm',
-                             '/def_1899.dcm',
-                             '/abc_2018.dcm',
-                             '/bcd_1899.dcm',
-                             '/def_1981.dcm',
-                             '/bcd_2018.dcm',
-                             '/def_2018.dcm',
-                             '/xyz_2018.dcm',
-                             '/xyz_1899.dcm',
-                             '/abc_1899.dcm',
-                             '/xyz_1981.dcm',
-                             '/bcd_1981.dcm',
-                         ])
-                         ),
-
-                        ('format > "DICOM" AND strings != ["b", "c", "d"]',
-                         set([
-                             '/xyz_1899.nii',
-                             '/xyz_1899.mgz',
-                             '/abc_1981.mgz',
-                             '/abc_2018.nii',
-                             '/xyz_2018.nii',
-                             '/abc_1899.mgz',
-                             '/def_1899.mgz',
-                             '/def_1899.nii',
-                             '/abc_1981.nii',
-                             '/def_2018.nii',
-                             '/def_1981.nii',
-                             '/abc_1899.nii',
-                             '/xyz_1981.nii',
-                             '/abc_2018.mgz',
-                             '/def_1981.mgz',
-                             '/xyz_2018.mgz',
-                             '/def_2018.mgz',
-                             '/xyz_1981.mgz'
-                         ])
-                         ),
-
-                        ('format <= "DICOM" AND strings == ["b", "c", "d"]',
-                         set([
-                             '/bcd_2018.dcm',
-                             '/bcd_1981.dcm',
-                             '/bcd_1899.dcm',
-                         ])
-                         ),
-
-                        ('has_format in [false, null]',
-                         set([
-                             '/def_1899.none',
-                             '/abc_1899.none',
-                             '/bcd_1899.none',
-                             '/xyz_1899.none',
-                             '/bcd_2018.none',
-                             '/abc_1981.none',
-                             '/def_2018.none',
-                             '/xyz_2018.none',
-                             '/abc_2018.none',
-                             '/def_1981.none',
-                             '/xyz_1981.none',
-                             '/bcd_1981.none',
-                         ])
-                         ),
-
-                        ('format == null',
-                         set([
-                             '/bcd_1981.none',
-                             '/abc_1899.none',
-                             '/def_1899.none',
-                             '/bcd_2018.none',
-                             '/abc_1981.none',
-                             '/def_2018.none',
-                             '/xyz_2018.none',
-                             '/abc_2018.none',
-                             '/def_1981.none',
-                             '/bcd_1899.none',
-                             '/xyz_1899.none',
-                             '/xyz_1981.none'
-                         ])
-                         ),
-
-                        ('strings == null',
-                         set()),
-
-                        ('strings != NULL',
-                         set([
-                             '/xyz_1899.nii',
-                             '/xyz_2018.dcm',
-                             '/xyz_1899.mgz',
-                             '/bcd_2018.mgz',
-                             '/bcd_1899.nii',
-                             '/def_2018.none',
-                             '/def_1899.mgz',
-                             '/def_1899.nii',
-                             '/bcd_1981.mgz',
-                             '/abc_1981.nii',
-                             '/def_2018.mgz',
-                             '/abc_1899.nii',
-                             '/bcd_2018.nii',
-                             '/abc_2018.dcm',
-                             '/xyz_1899.none',
-                             '/bcd_1899.dcm',
-                             '/bcd_1981.none',
-                             '/def_1981.dcm',
-                             '/abc_2018.nii',
-                             '/def_1899.none',
-                             '/xyz_1981.none',
-                             '/abc_1981.dcm',
-                             '/bcd_2018.dcm',
-                             '/def_2018.nii',
-                             '/abc_1981.mgz',
-                             '/def_2018.dcm',
-                             '/abc_1899.none',
-                             '/xyz_1981.mgz',
-                             '/xyz_1899.dcm',
-                             '/abc_1899.dcm',
-                             '/def_1899.dcm',
-                             '/bcd_1981.nii',
-                             '/def_1981.none',
-                             '/xyz_1981.nii',
-                             '/abc_2018.mgz',
-                             '/xyz_2018.none',
-                             '/xyz_2018.nii',
-                             '/abc_1899.mgz',
-                             '/bcd_1899.mgz',
-                             '/bcd_2018.none',
-                             '/abc_1981.none',
-                             '/xyz_1981.dcm',
-                             '/abc_2018.none',
-                             '/def_1981.nii',
-                             '/bcd_1981.dcm',
-                             '/def_1981.mgz',
-                             '/bcd_1899.none',
-                             '/xyz_2018.mgz'
-                         ])
-                         ),
-
-                        ('format != NULL',
-                         set([
-                             '/xyz_1899.nii',
-                             '/xyz_1899.mgz',
-                             '/bcd_2018.mgz',
-                             '/bcd_1899.nii',
-                             '/def_1899.mgz',
-                             '/def_1899.nii',
-                             '/bcd_1981.mgz',
-                             '/abc_1981.nii',
-                             '/def_2018.mgz',
-                             '/abc_1899.nii',
-                             '/bcd_2018.nii',
-                             '/abc_2018.dcm',
-                             '/xyz_1981.mgz',
-                             '/def_1981.dcm',
-                             '/abc_2018.nii',
-                             '/abc_1981.dcm',
-                             '/bcd_2018.dcm',
-                             '/def_2018.nii',
-                             '/bcd_1981.nii',
-                             '/abc_1981.mgz',
-                             '/def_2018.dcm',
-                             '/bcd_1899.dcm',
-                             '/xyz_2018.dcm',
-                             '/xyz_1899.dcm',
-                             '/abc_1899.dcm',
-                             '/def_1899.dcm',
-                             '/bcd_1899.mgz',
-                             '/xyz_1981.nii',
-                             '/abc_2018.mgz',
-                             '/xyz_2018.nii',
-                             '/abc_1899.mgz',
-                             '/xyz_1981.dcm',
-                             '/def_1981.nii',
-                             '/bcd_1981.dcm',
-                             '/def_1981.mgz',
-                             '/xyz_2018.mgz'
-                         ])
-                         ),
-
-                        ('name like "%.nii"',
-                         set([
-                             '/xyz_1899.nii',
-                             '/xyz_2018.nii',
-                             '/abc_2018.nii',
-                             '/bcd_1899.nii',
-                             '/bcd_2018.nii',
-                             '/def_1899.nii',
-                             '/abc_1981.nii',
-                             '/def_2018.nii',
-                             '/def_1981.nii',
-                             '/bcd_1981.nii',
-                             '/abc_1899.nii',
-                             '/xyz_1981.nii'
-                         ])
-                         ),
-
-                        ('name ilike "%A%"',
-                         set([
-                             '/abc_1899.none',
-                             '/abc_1899.nii',
-                             '/abc_2018.nii',
-                             '/abc_1899.mgz',
-                             '/abc_1899.dcm',
-                             '/abc_1981.dcm',
-                             '/abc_1981.nii',
-                             '/abc_1981.mgz',
-                             '/abc_2018.mgz',
-                             '/abc_2018.dcm',
-                             '/abc_2018.none',
-                             '/abc_1981.none'
-                         ])
-                         ),
-
-                        ('all',
-                         set([
-                             '/xyz_1899.nii',
-                             '/xyz_2018.dcm',
-                             '/xyz_1899.mgz',
-                             '/bcd_2018.mgz',
-                             '/bcd_1899.nii',
-                             '/def_2018.none',
-                             '/def_1899.mgz',
-                             '/def_1899.nii',
-                             '/bcd_1981.mgz',
-                             '/abc_1981.nii',
-                             '/def_2018.mgz',
-                             '/abc_1899.nii',
-                             '/bcd_2018.nii',
-                             '/abc_2018.dcm',
-                             '/xyz_1899.none',
-                             '/bcd_1899.dcm',
-                             '/bcd_1981.none',
-                             '/def_1981.dcm',
-                             '/abc_2018.nii',
-                             '/def_1899.none',
-                             '/xyz_1981.none',
-                             '/abc_1981.dcm',
-                             '/bcd_2018.dcm',
-                             '/def_2018.nii',
-                             '/abc_1981.mgz',
-                             '/def_2018.dcm',
-                             '/abc_1899.none',
-                             '/xyz_1981.mgz',
-                             '/xyz_1899.dcm',
-                             '/abc_1899.dcm',
-                             '/def_1899.dcm',
-                             '/bcd_1981.nii',
-                             '/def_1981.none',
-                             '/xyz_1981.nii',
-                             '/abc_2018.mgz',
-                             '/xyz_2018.none',
-                             '/xyz_2018.nii',
-                             '/abc_1899.mgz',
-                             '/bcd_1899.mgz',
-                             '/bcd_2018.none',
-                             '/abc_1981.none',
-                             '/xyz_1981.dcm',
-                             '/abc_2018.none',
-                             '/def_1981.nii',
-                             '/bcd_1981.dcm',
-                             '/def_1981.mgz',
-                             '/bcd_1899.none',
-                             '/xyz_2018.mgz'
-                         ])
-                         )):
+                formats = (('NIFTI', 'nii'),
+                           ('DICOM', 'dcm'),
+                           ('Freesurfer', 'mgz'))
+                strings_by_file = dict((file, list(file)) for file in files)
+                documents = [dict(name='/%s_%d.%s' % (file, dt.year, ext),
+                                  format=format,
+                                  strings=strings_by_file[file],
+                                  datetime=dt,
+                                  has_format=True)
+                             for file, dt, (format, ext)
+                             in itertools.product(files, list_datetime, formats)]
+                documents += [dict(name='/%s_%d.none' % (file, dt.year),
+                                   strings=strings_by_file[file])
+                              for file, dt in itertools.product(files, list_datetime)]
+                session.add_documents("collection1", documents)
+
+                # Checking that the index created for the format field is used
+                collection, where = session.filter_query("collection1", 'format == "NIFTI"')
+                plan = session.engine.cursor.execute(
+                    'EXPLAIN QUERY PLAN SELECT * FROM [collection1] WHERE %s' % where).fetchall()
+                self.assertIn('USING INDEX', ' '.join(row[-1] for row in plan))
+                # The items of the indexed list field are searched by value
+                collection, where = session.filter_query("collection1", '"b" IN strings')
+                plan = session.engine.cursor.execute(
+                    'EXPLAIN QUERY PLAN SELECT * FROM [collection1] WHERE %s' % where).fetchall()
+                self.assertIn('USING INDEX list_collection1_strings_value',
+                              ' '.join(row[-1] for row in plan))
+
+                # Pattern matching is evaluated after cheaper conditions
+                for filter in ('name like "/a%" AND format == "NIFTI"',
+                               'name ilike "/A%" AND format == "NIFTI"'):
+                    collection, where = session.filter_query("collection1", filter)
+                    self.assertTrue(where.startswith("( [format] IS 'NIFTI' )"), where)
+
+                all_documents = set(name for name, in session.filter_documents(
+                    "collection1", 'ALL', fields=['name'], as_list=True))
+                for filter, expected in FILTER_CASES:
+                    # Whole documents, list values are read with the filter
+                    with sub_test(self, filter=filter):
+                        documents = list(session.filter_documents("collection1", filter))
+                        self.assertEqual(set(document.name for document in documents), expected)
+                        for document in documents:
+                            self.assertEqual(document.strings, list(document.name[1:4]))
                     for tested_filter in (filter, '(%s) AND ALL' % filter, 'ALL AND (%s)' % filter):
-                        try:
-                            documents = set(document.name for document in session.filter_documents("collection1", tested_filter))
+                        with sub_test(self, tested_filter=tested_filter):
+                            documents = set(session.filter_documents_names("collection1", tested_filter))
                             self.assertEqual(documents, expected)
-                        except Exception as e:
-                            e.message = 'While testing filter : %s\n%s' % (str(tested_filter), str(e))
-                            e.args = (e.message,)
-                            raise
-                    all_documents = set(document.name for document in session.filter_documents("collection1", 'ALL'))
                     for tested_filter in ('(%s) OR ALL' % filter, 'ALL OR (%s)' % filter):
-                        try:
-                            documents = set(document.name for document in session.filter_documents("collection1", tested_filter))
+                        with sub_test(self, tested_filter=tested_filter):
+                            documents = set(session.filter_documents_names("collection1", tested_filter))
                             self.assertEqual(documents, all_documents)
-                        except Exception as e:
-                            e.message = 'While testing filter : %s\n%s' % (str(tested_filter), str(e))
-                            e.args = (e.message,)
-                            raise
 
         def test_modify_list_field(self):
             database = self.create_database()
@@ -1877,16 +2113,127 @@ def create_test_case(**database_creation_parameters):
             literals['[%s]' % ','.join(literals.keys())] = list(literals.values())
 
             parser = literal_parser()
+            transformer = FilterToQuery(None, None)
             for literal, expected_value in literals.items():
                 tree = parser.parse(literal)
-                value = FilterToQuery(None, None).transform(tree)
+                value = transformer.transform(tree)
                 self.assertEqual(value, expected_value)
 
+        @unittest.skipIf(sys.version_info[0] < 3,
+                         'SQLite URIs are not supported by Python 2')
+        def test_read_only(self):
+            """
+            Tests opening a database in read-only mode with an SQLite URI
+            """
+
+            self.use_database_file()
+            database = self.create_database()
+            with database as session:
+                session.add_collection("collection1", "name")
+                session.add_document("collection1", {"name": "toto"})
+
+            path = self.database_url[len('sqlite:///'):]
+            database = Database('sqlite:///file:%s?mode=ro' % path)
+            with database as session:
+                self.assertEqual(session.get_documents_names("collection1"), ["toto"])
+                with self.assertRaises(sqlite3.OperationalError):
+                    session.add_document("collection1", {"name": "titi"})
+
+        def test_add_fields_error(self):
+            """
+            Tests that the fields created by add_fields before an error are
+            valid fields
+            """
+
+            database = self.create_database()
+            with database as session:
+                session.add_collection("collection1", "name")
+                # A column unknown to populse_db makes the second field fail
+                session.engine.cursor.execute('ALTER TABLE [collection1] ADD COLUMN [f2] TEXT')
+                with self.assertRaises(sqlite3.OperationalError):
+                    session.add_fields([["collection1", "f1", FIELD_TYPE_STRING, None],
+                                        ["collection1", "f2", FIELD_TYPE_STRING, None],
+                                        ["collection1", "f3", FIELD_TYPE_STRING, None]])
+                # The fields are read from the database as in a new session
+                session.engine._load_caches()
+                self.assertEqual(session.get_field("collection1", "f1").field_type,
+                                 FIELD_TYPE_STRING)
+                self.assertIsNone(session.get_field("collection1", "f3"))
+                with self.assertRaises(ValueError):
+                    session.add_field("collection1", "f1", FIELD_TYPE_STRING, None)
+                session.add_document("collection1", {"name": "document1", "f1": "value"})
+                self.assertEqual(session.get_value("collection1", "document1", "f1"), "value")
+
+        def test_document_after_schema_change(self):
+            """
+            Tests that a document keeps its fields when fields are added to
+            or removed from its collection after it was read
+            """
+
+            database = self.create_database()
+            with database as session:
+                session.add_collection("collection1", "name")
+                session.add_field("collection1", "a", FIELD_TYPE_STRING, None)
+                session.add_document("collection1", {"name": "n", "a": "v"})
+
+            with database as session:
+                document = session.get_document("collection1", "n")
+
+            with database as session:
+                session.add_field("collection1", "b", FIELD_TYPE_STRING, None)
+            self.assertEqual(document._dict(), {"name": "n", "a": "v"})
+            with self.assertRaises(AttributeError):
+                document.b
+
+            with database as session:
+                session.remove_field("collection1", "a")
+                self.assertEqual(session.get_document("collection1", "n")._dict(),
+                                 {"name": "n"})
+            self.assertEqual(document._dict(), {"name": "n", "a": "v"})
+            self.assertEqual(document.a, "v")
+
+        def test_rollback(self):
+            """
+            Tests that a rollback removes the collections and fields
+            modifications of the session
+            """
+
+            self.use_database_file()
+            database = self.create_database()
+            with database as session:
+                session.add_collection("collection1", "name")
+
+            with database as session:
+                session.add_collection("collection2", "name")
+                session.add_field("collection1", "field1", FIELD_TYPE_STRING, None)
+                session.rollback()
+                self.assertIsNone(session.get_collection("collection2"))
+                self.assertIsNone(session.get_field("collection1", "field1"))
+                self.assertEqual(session.get_collections_names(), ["collection1"])
+                self.assertEqual(session.get_fields_names("collection1"), ["name"])
+
+            with database as session:
+                self.assertIsNone(session.get_collection("collection2"))
+                self.assertIsNone(session.get_field("collection1", "field1"))
+
+            # The tables created for a new database are also rolled back
+            path = os.path.join(self.temp_folder, '%s_new.db' % self._testMethodName)
+            database = Database('sqlite:///' + path)
+            with database as session:
+                session.add_collection("collection1", "name")
+                session.rollback()
+                self.assertEqual(session.get_collections_names(), [])
+            with database as session:
+                session.add_collection("collection1", "name")
+            with database as session:
+                self.assertEqual(session.get_collections_names(), ["collection1"])
+
         def test_with(self):
             """
             Tests the database session
             """
 
+            self.use_database_file()
             database = self.create_database()
             try:
                 with database as session:
@@ -1934,34 +2281,20 @@ def create_test_case(**database_creation_parameters):
             """
             database = self.create_database()
             with database as session:
-                now = datetime.datetime.now()
                 session.add_collection('test')
-                base_doc = {
-                    'string': 'string',
-                    'int': 1,
-                    'float': 1.4,
-                    'boolean': True,
-                    'datetime': now,
-                    'date': now.date(),
-                    'time': now.time(),
-                    'dict': {
-                        'string': 'string',
-                        'int': 1,
-                        'float': 1.4,
-                        'boolean': True,
-                    }
-                }
-                doc = base_doc.copy()
-                for k, v in base_doc.items():
-                    lk = 'list_%s' % k
-                    doc[lk] = [v]
-                doc['index'] = 'test'
+                doc = DOC_WITH_LISTS
                 session.add_document('test', doc)
                 stored_doc = session.get_document('test', 'test')._dict()
                 self.assertEqual(doc, stored_doc)
     
     return TestDatabaseMethods
 
+# Test cases are created at module level so that test runners that do not
+# use load_tests (e.g. pytest) also collect them. They are independent and
+# can be run in parallel.
+TestDatabaseMethodsInMemory = create_test_case()
+TestDatabaseMethodsOnDisk = create_test_case(on_disk=True)
+
 def load_tests(loader, standard_tests, pattern):
     """
     Prepares the tests parameters
@@ -1976,7 +2309,12 @@ def load_tests(loader, standard_tests, pattern):
     """
     suite = unittest.TestSuite()
     suite.addTests(loader.loadTestsFromTestCase(TestsSQLiteInMemory))
-    tests = loader.loadTestsFromTestCase(create_test_case())
+    suite.addTests(loader.loadTestsFromTestCase(TestReadOnlyDatabase))
+    suite.addTests(loader.loadTestsFromTestCase(TestReadOnlyDatabaseOnDisk))
+    tests = loader.loadTestsFromTestCase(TestDatabaseMethodsInMemory)
+    suite.addTests(tests)
+    # Same tests with a database file
+    tests = loader.loadTestsFromTestCase(TestDatabaseMethodsOnDisk)
     suite.addTests(tests)
 
     # Tests with postgresql. All the tests will be skiped if